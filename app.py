@@ -1,18 +1,27 @@
 # todo hold values for each page in a session store
 # todo highlight active page in the menu
 
+# Set LMT_IMPORT_PROFILE=1 to print how long each module takes to import
+from utils import import_profile
+if import_profile.profiling_requested():
+    import_profile.enable()
+
 import dash
 from dash import html, dcc, Input, Output
+from flask import request, jsonify
 import dash_bootstrap_components as dbc
 from layouts import menubar
 from layouts.rsr import rsfend
 from layouts.toltec import dilutionFridge, cryocmp, thermetry
 from callbacks.callbacks import register_callbacks
+from utils.index_watcher import start_index_watcher
+from utils.warmup import start_warmup, warmup_status
 import yaml
 
 with open('config.yaml') as f:
     config = yaml.load(f, Loader=yaml.FullLoader)
 prefix = config['prefix']
+transport_config = config.get('transport', {})
 
 
 external_stylesheets = [
@@ -24,6 +33,7 @@ external_stylesheets = [
 
 app = dash.Dash(__name__, external_stylesheets=external_stylesheets, suppress_callback_exceptions=True,
                 routes_pathname_prefix=f'{prefix}/', requests_pathname_prefix=f'{prefix}/',
+                compress=bool(transport_config.get('compress')),
                 )
 app.config.prevent_initial_callbacks = 'initial_duplicate'
 
@@ -37,6 +47,7 @@ app.layout = dbc.Container([
     ]),
     dcc.Location(id='url', refresh=False),
     dcc.Store(id='app-state', storage_type='session'),
+    dcc.Store(id='graph-width'),
 ], fluid=True)
 
 def get_layout(pathname):
@@ -57,9 +68,45 @@ def get_layout(pathname):
 def render_content(pathname):
     return get_layout(pathname)
 
+# Report the browser width so update_plot can decimate traces to what the graph can show
+app.clientside_callback(
+    "function(pathname) { return window.innerWidth; }",
+    Output('graph-width', 'data'),
+    Input('url', 'pathname'),
+    prevent_initial_call=False
+)
+
 register_callbacks(app)
 
+index_watcher_config = config.get('index_watcher', {})
+if index_watcher_config.get('enabled'):
+    start_index_watcher(list(config['fixed_directories']), index_watcher_config.get('poll_interval', 60))
+
+# Load the indexes and the default view's data in the background so the first visitor does not wait
+warmup_config = config.get('warmup', {})
+if warmup_config.get('enabled'):
+    start_warmup(list(config['fixed_directories']), warmup_config.get('hours', 5))
+
 server = app.server
 
+
+@server.route(f'{prefix}/health/ready')
+def health_ready():
+    status = warmup_status()
+    ready = status['state'] in ('ready', 'not started')
+    return jsonify(ready=ready, **status), 200 if ready else 503
+
+# Log the size of every callback response before compression; the compressed size is in the access log
+if transport_config.get('log_payload'):
+    @server.after_request
+    def log_payload_size(response):
+        if request.path.endswith('_dash-update-component') and not response.direct_passthrough:
+            body = request.get_json(silent=True) or {}
+            print(f"Callback {body.get('output', '?')}: {response.calculate_content_length()} bytes, "
+                  f"accepts {request.headers.get('Accept-Encoding', 'no encoding')}")
+        return response
+
 if __name__ == '__main__':
+    if import_profile.profiling_requested():
+        import_profile.report()
     app.run_server(debug=True, port=8000)
\ No newline at end of file
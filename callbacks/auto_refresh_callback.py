@@ -0,0 +1,38 @@
+from dash import Input, Output, State
+from dash.exceptions import PreventUpdate
+
+
+def auto_refresh_register_callbacks(app, id_prefix):
+    # The interval only runs while auto refresh is on and a 'Last N hours' figure is shown
+    @app.callback(
+        [
+            Output(f'{id_prefix}-refresh-interval', 'disabled'),
+            Output(f'{id_prefix}-refresh-interval', 'interval'),
+        ],
+        [
+            Input(f'auto-refresh-{id_prefix}', 'value'),
+            Input(f'{id_prefix}-refresh-state', 'data'),
+        ],
+        prevent_initial_call=False,
+    )
+    def toggle_auto_refresh(enabled, state):
+        from utils.auto_refresh import REFRESH_SECONDS
+        return not (enabled and state), REFRESH_SECONDS * 1000
+
+    # Send only the samples the browser has not seen yet
+    @app.callback(
+        [
+            Output(f'{id_prefix}-plot', 'extendData'),
+            Output(f'{id_prefix}-refresh-state', 'data', allow_duplicate=True),
+        ],
+        Input(f'{id_prefix}-refresh-interval', 'n_intervals'),
+        State(f'{id_prefix}-refresh-state', 'data'),
+    )
+    def refresh_plot(n_intervals, state):
+        if not state:
+            raise PreventUpdate
+        from utils.auto_refresh import extend_data
+        extend, new_state = extend_data(id_prefix, state)
+        if extend is None:
+            raise PreventUpdate
+        return extend, new_state
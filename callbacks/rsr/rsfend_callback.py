@@ -1,19 +1,16 @@
 import os
 
-import pandas as pd
 import yaml
 from dash import Input, Output, State
 from dash.exceptions import PreventUpdate
 import traceback
-from data_files.rsr.rsfend import RsFendFile
-from utils.plot_utils import update_plot
-from utils.data_utils import load_config, load_all_data, get_files
+from utils.config_utils import load_config
+from utils.result_cache import cached_result
 
 config_path = "./config.yaml"
 config=load_config(config_path)
 
 FIXED_DIRECTORY = config['fixed_directories']['rsfend']
-_rsfend_cached_data = None
 def rsfend_register_callbacks(app):
     @app.callback(
         [
@@ -37,14 +34,12 @@ def rsfend_register_callbacks(app):
         [Input('hours-dropdown-rsfend', 'value'),]
     )
     def update_rsfend_date_picker(n):
-        global _rsfend_cached_data
+        # The data stack is imported on first use rather than at startup
+        import pandas as pd
+        from utils.data_utils import get_index_summary
 
-        if _rsfend_cached_data is None:
-            disabled_dates, min_date, max_date = load_all_data('rsfend')
-            _rsfend_cached_data = (disabled_dates, min_date, max_date)
-        else:
-            disabled_dates, min_date, max_date = _rsfend_cached_data
-            # Ensure date objects for consistent comparison
+        disabled_dates, min_date, max_date = get_index_summary('rsfend')
+        # Ensure date objects for consistent comparison
         if isinstance(min_date, pd.Timestamp):
             min_date = min_date.date()
         if isinstance(max_date, pd.Timestamp):
@@ -63,26 +58,54 @@ def rsfend_register_callbacks(app):
             State('rsfend-date-picker-range', 'start_date'),
             State('rsfend-date-picker-range', 'end_date'),
             State('hours-dropdown-rsfend', 'value'),
-
+            State('graph-width', 'data'),
         ]
         )
-    def update_rsfend_plot(n, start_date, end_date, hours ):
+    @cached_result('rsfend')
+    def update_rsfend_plot(n, start_date, end_date, hours, graph_width):
         if n is None:
             raise PreventUpdate
+        from data_files.rsr.rsfend import RsFendFile
+        from utils.plot_utils import update_plot, target_points
+        from utils.data_utils import get_files, get_file_index, get_time_window, window_dates
+        from utils.rollup_store import use_rollups, get_rollup_plot_data
+        from utils.day_cache import day_cache_enabled, load_plot_data
+        from utils.file_cache import open_data_file
+        from utils.live_tail import live_tail_enabled, get_live_tail
+        from utils.merge_utils import merge_plot_data
+
+        window = get_time_window('rsfend', hours, start_date, end_date)
+        if use_rollups('rsfend', window):
+            plot_data = get_rollup_plot_data('rsfend', *window, target_points(graph_width))
+            return update_plot('Rsfend', plot_data, hours, options=None, split_value=None)
+        if day_cache_enabled() and window is not None:
+            plot_data, _ = load_plot_data('rsfend', *window)
+            if hours > 0 and live_tail_enabled():
+                plot_data.extend(get_live_tail('rsfend').plot_data(*window))
+            plot_data = merge_plot_data(plot_data, window)
+            return update_plot('Rsfend', plot_data, hours, options=None, split_value=None,
+                               max_points=target_points(graph_width))
         files = get_files('rsfend', hours, start_date, end_date)
         data = []
         plot_data = []
         try:
             for file in files:
                 file_path = os.path.join(FIXED_DIRECTORY, file)
-                rsfend_file = RsFendFile(file_path)
-                plot_data = rsfend_file.getData(start_date, end_date, hours)
+                rsfend_file = open_data_file(RsFendFile, file_path, window,
+                                             get_file_index().empty_variables('rsfend', file))
+                # Every file is cut to the same window, which includes the whole end day
+                plot_data = rsfend_file.getData(*window_dates(window), 0)
 
                 if not plot_data:
                     print(f"Empty plot data for file: {file}")
                     continue
-            data.extend(plot_data)
-            fig = update_plot('Rsfend', plot_data, hours, options=None, split_value=None)
+                data.extend(plot_data)
+            if hours > 0 and live_tail_enabled() and window is not None:
+                data.extend(get_live_tail('rsfend').plot_data(*window))
+            # One contiguous trace per channel across all files
+            plot_data = merge_plot_data(data, window)
+            fig = update_plot('Rsfend', plot_data, hours, options=None, split_value=None,
+                              max_points=target_points(graph_width))
             return fig
 
         except Exception as e:
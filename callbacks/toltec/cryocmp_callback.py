@@ -1,17 +1,14 @@
 import os
-import pandas as pd
 from dash import Input, Output, State
 from dash.exceptions import PreventUpdate
 import traceback
-from data_files.toltec.cryocmp_file import ToltecCryocmpFile
-from utils.plot_utils import update_plot
-from utils.data_utils import load_config, load_all_data, get_files
+from utils.config_utils import load_config
+from utils.result_cache import cached_result
 
 config_path = "./config.yaml"
 config = load_config(config_path)
 
 FIXED_DIRECTORY = config['fixed_directories']['cryocmp']
-_cryocmp_cached_data = None
 def cryocmp_register_callbacks(app):
     @app.callback(
         [
@@ -35,14 +32,12 @@ def cryocmp_register_callbacks(app):
         [Input('hours-dropdown-cryocmp', 'value'),]
     )
     def update_cryocmp_date_picker(n):
-        global _cryocmp_cached_data
+        # The data stack is imported on first use rather than at startup
+        import pandas as pd
+        from utils.data_utils import get_index_summary
 
-        if _cryocmp_cached_data is None:
-            disabled_dates, min_date, max_date = load_all_data('cryocmp')
-            _cryocmp_cached_data = (disabled_dates, min_date, max_date)
-        else:
-            disabled_dates, min_date, max_date = _cryocmp_cached_data
-            # Ensure date objects for consistent comparison
+        disabled_dates, min_date, max_date = get_index_summary('cryocmp')
+        # Ensure date objects for consistent comparison
         if isinstance(min_date, pd.Timestamp):
             min_date = min_date.date()
         if isinstance(max_date, pd.Timestamp):
@@ -61,26 +56,54 @@ def cryocmp_register_callbacks(app):
             State('cryocmp-date-picker-range', 'start_date'),
             State('cryocmp-date-picker-range', 'end_date'),
             State('hours-dropdown-cryocmp', 'value'),
-
+            State('graph-width', 'data'),
         ]
         )
-    def update_cryocmp_plot(n, start_date, end_date, hours ):
+    @cached_result('cryocmp')
+    def update_cryocmp_plot(n, start_date, end_date, hours, graph_width):
         if n is None:
             raise PreventUpdate
+        from data_files.toltec.cryocmp_file import ToltecCryocmpFile
+        from utils.plot_utils import update_plot, target_points
+        from utils.data_utils import get_files, get_file_index, get_time_window, window_dates
+        from utils.rollup_store import use_rollups, get_rollup_plot_data
+        from utils.day_cache import day_cache_enabled, load_plot_data
+        from utils.file_cache import open_data_file
+        from utils.live_tail import live_tail_enabled, get_live_tail
+        from utils.merge_utils import merge_plot_data
+
+        window = get_time_window('cryocmp', hours, start_date, end_date)
+        if use_rollups('cryocmp', window):
+            plot_data = get_rollup_plot_data('cryocmp', *window, target_points(graph_width))
+            return update_plot('Cryocmp', plot_data, hours, options=None, split_value=None)
+        if day_cache_enabled() and window is not None:
+            plot_data, _ = load_plot_data('cryocmp', *window)
+            if hours > 0 and live_tail_enabled():
+                plot_data.extend(get_live_tail('cryocmp').plot_data(*window))
+            plot_data = merge_plot_data(plot_data, window)
+            return update_plot('Cryocmp', plot_data, hours, options=None, split_value=None,
+                               max_points=target_points(graph_width))
         files = get_files('cryocmp', hours, start_date, end_date)
         data = []
         plot_data = []
         try:
             for file in files:
                 file_path = os.path.join(FIXED_DIRECTORY, file)
-                cryocmp_file = ToltecCryocmpFile(file_path)
-                plot_data = cryocmp_file.getData(start_date, end_date, hours)
+                cryocmp_file = open_data_file(ToltecCryocmpFile, file_path, window,
+                                              get_file_index().empty_variables('cryocmp', file))
+                # Every file is cut to the same window, which includes the whole end day
+                plot_data = cryocmp_file.getData(*window_dates(window), 0)
 
                 if not plot_data:
                     print(f"Empty plot data for file: {file}")
                     continue
-            data.extend(plot_data)
-            fig = update_plot('Cryocmp', plot_data, hours, options=None, split_value=None)
+                data.extend(plot_data)
+            if hours > 0 and live_tail_enabled() and window is not None:
+                data.extend(get_live_tail('cryocmp').plot_data(*window))
+            # One contiguous trace per channel across all files
+            plot_data = merge_plot_data(data, window)
+            fig = update_plot('Cryocmp', plot_data, hours, options=None, split_value=None,
+                              max_points=target_points(graph_width))
             return fig
 
         except Exception as e:
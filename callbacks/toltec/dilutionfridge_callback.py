@@ -1,23 +1,18 @@
 import os
 
-import pandas as pd
 import yaml
 from dash import Input, Output, State, ctx
 from dash.exceptions import PreventUpdate
-from utils.data_utils import load_config
+from utils.config_utils import load_config
 import traceback
 
-from data_files.toltec.dilutionfridge_file import ToltecDilutionFridgeFile
-from data_files.toltec.thermetry_file import ToltecThermetryFile
-from utils.plot_utils import update_plot
-from utils.data_utils import load_all_data, get_files
+from utils.result_cache import cached_result
+from callbacks.auto_refresh_callback import auto_refresh_register_callbacks
 
 config_path = "./config.yaml"
-_dilutionFridge_cached_data = None
 config = load_config(config_path)
 FIXED_DIRECTORY = config['fixed_directories']['dilutionFridge']
 
-_dilutionfridge_cached_data = None
 def dilutionfridge_register_callbacks(app):
     # if time range options is 0, show the custom range date picker
     @app.callback(
@@ -31,18 +26,15 @@ def dilutionfridge_register_callbacks(app):
         ],
         [Input('hours-dropdown-dilutionFridge', 'value'),]
     )
-    def update_dilutionfridge_date_picker(hours, _dilutionfridge_cached_data=None):
+    def update_dilutionfridge_date_picker(hours):
 
         # Control display style of date picker based on hours
         style = {'display': 'block'} if hours == 0 else {'display': 'none'}
-        # Load data if not cached
-        if _dilutionfridge_cached_data is None:
-            disabled_dates, min_date, max_date = load_all_data('dilutionFridge')
-            print('disabled_dates', len(disabled_dates), 'min_date', min_date, 'max_date', max_date)
-            _dilutionfridge_cached_data = (disabled_dates, min_date, max_date)
-        else:
-            # Use cached data
-            disabled_dates, min_date, max_date = _dilutionfridge_cached_data
+        # The data stack is imported on first use rather than at startup
+        import pandas as pd
+        from utils.data_utils import get_index_summary
+        # Summary of the file index, recomputed only when the index changes
+        disabled_dates, min_date, max_date = get_index_summary('dilutionFridge')
 
         # Ensure date consistency
         if isinstance(min_date, pd.Timestamp):
@@ -60,6 +52,7 @@ def dilutionfridge_register_callbacks(app):
     @app.callback(
     [
         Output('dilutionFridge-plot', 'figure'),
+        Output('dilutionFridge-refresh-state', 'data'),
     ],
     Input('dilutionFridge-apply-btn', 'n_clicks'),
     [
@@ -67,11 +60,38 @@ def dilutionfridge_register_callbacks(app):
         State('dilutionFridge-date-picker-range', 'end_date'),
         State('hours-dropdown-dilutionFridge', 'value'),
         State('data-selection-dilutionFridge', 'value'),
+        State('graph-width', 'data'),
     ],
     )
-    def update_dilutionFridge_plot(n, start_date, end_date, hours, data_selection):
+    @cached_result('dilutionFridge')
+    def update_dilutionFridge_plot(n, start_date, end_date, hours, data_selection, graph_width):
         if n is None:
             raise PreventUpdate
+        from data_files.toltec.dilutionfridge_file import ToltecDilutionFridgeFile
+        from utils.plot_utils import update_plot, target_points
+        from utils.data_utils import get_files, get_file_index, get_time_window, window_dates
+        from utils.rollup_store import use_rollups, get_rollup_plot_data
+        from utils.day_cache import day_cache_enabled, load_plot_data
+        from utils.file_cache import open_data_file
+        from utils.live_tail import live_tail_enabled, get_live_tail
+        from utils.merge_utils import merge_plot_data
+        from utils.auto_refresh import refresh_state
+
+        window = get_time_window('dilutionFridge', hours, start_date, end_date)
+        if use_rollups('dilutionFridge', window):
+            plot_data = get_rollup_plot_data('dilutionFridge', *window, target_points(graph_width),
+                                             channels=ToltecDilutionFridgeFile.labels_for(data_selection))
+            return [update_plot('Dilution Fridge', plot_data, hours, options=None, split_value=None), None]
+        if day_cache_enabled() and window is not None:
+            labels = ToltecDilutionFridgeFile.labels_for(data_selection)
+            plot_data, _ = load_plot_data('dilutionFridge', *window, channels=labels)
+            if hours > 0 and live_tail_enabled():
+                live_data = get_live_tail('dilutionFridge').plot_data(*window)
+                plot_data.extend(trace for trace in live_data if trace['name'] in labels)
+            plot_data = merge_plot_data(plot_data, window)
+            fig = update_plot('Dilution Fridge', plot_data, hours, options=None, split_value=None,
+                              max_points=target_points(graph_width))
+            return [fig, refresh_state(fig, hours, window, target_points(graph_width))]
 
         files = get_files('dilutionFridge', hours, start_date, end_date)
         data = []
@@ -79,15 +99,27 @@ def dilutionfridge_register_callbacks(app):
         try:
             for file in files:
                 file_path = os.path.join(FIXED_DIRECTORY, file)
-                dilutionFridge_file = ToltecDilutionFridgeFile(file_path)
-                plot_data = dilutionFridge_file.getData(data_selection, hours, start_date, end_date)
+                # Variables the index knows are empty in the file are not read
+                dilutionFridge_file = open_data_file(ToltecDilutionFridgeFile, file_path, window,
+                                                     get_file_index().empty_variables('dilutionFridge', file))
+                # Every file is cut to the same window, which includes the whole end day
+                plot_data = dilutionFridge_file.getData(data_selection, 0, *window_dates(window))
                 data.extend(plot_data)
+            if hours > 0 and live_tail_enabled() and window is not None:
+                labels = set(ToltecDilutionFridgeFile.labels_for(data_selection))
+                live_data = get_live_tail('dilutionFridge').plot_data(*window)
+                data.extend(trace for trace in live_data if trace['name'] in labels)
+            # One contiguous trace per channel across all files
+            plot_data = merge_plot_data(data, window)
 
-            fig = update_plot('Dilution Fridge', plot_data, hours, options=None, split_value=None)
+            fig = update_plot('Dilution Fridge', plot_data, hours, options=None, split_value=None,
+                              max_points=target_points(graph_width))
 
-            return [fig]
+            return [fig, refresh_state(fig, hours, window, target_points(graph_width))]
 
         except Exception as e:
             error_message = f"Error processing file: {str(e)}"
             print(error_message)
-            print(traceback.format_exc())
\ No newline at end of file
+            print(traceback.format_exc())
+
+    auto_refresh_register_callbacks(app, 'dilutionFridge')
@@ -1,22 +1,26 @@
 import os
 
-import pandas as pd
 import yaml
 from dash import Input, Output, State, ctx
 from dash.exceptions import PreventUpdate
 import plotly.graph_objs as go
 import dash_bootstrap_components as dbc
 import traceback
-from data_files.toltec.thermetry_file import ToltecThermetryFile
-from utils.plot_utils import update_plot
-from utils.data_utils import load_all_data, get_files, load_config
+from utils.config_utils import load_config
+from utils.result_cache import cached_result
+from callbacks.auto_refresh_callback import auto_refresh_register_callbacks
 
 config_path = "./config.yaml"
 config = load_config(config_path)
 
 FIXED_DIRECTORY = config['fixed_directories']['thermetry']
 
-_thermetry_cached_data = None
+
+def _covered_channels(data, coverage):
+    """Traces of data without the channels the index found empty or all zero, which the raw file path skips"""
+    return [trace for trace in data if coverage.get(trace['name'], True)]
+
+
 def thermetry_register_callbacks(app):
     # if time range options is 0, show the custom range date picker
     @app.callback(
@@ -31,18 +35,15 @@ def thermetry_register_callbacks(app):
         [Input('hours-dropdown-thermetry', 'value'),]
     )
     def update_thermetry_date_picker(hours):
-        global _thermetry_cached_data
-
         # Part 1: Show or hide the date picker based on hours
         style = {'display': 'block'} if hours == 0 else {'display': 'none'}
 
-        # Part 2: Set disabled days and date range based on data
-        if _thermetry_cached_data is None:
-            disabled_dates, min_date, max_date = load_all_data('thermetry')
-            print('min_date from cached_data', min_date, 'max_date', max_date)
-            _thermetry_cached_data = (disabled_dates, min_date, max_date)
-        else:
-            disabled_dates, min_date, max_date = _thermetry_cached_data
+        # The data stack is imported on first use rather than at startup
+        import pandas as pd
+        from utils.data_utils import get_index_summary
+
+        # Part 2: Set disabled days and date range based on the file index
+        disabled_dates, min_date, max_date = get_index_summary('thermetry')
 
         # Ensure date objects for consistent comparison
         if isinstance(min_date, pd.Timestamp):
@@ -59,7 +60,8 @@ def thermetry_register_callbacks(app):
     @app.callback(
         [
             Output('thermetry-plot', 'figure'),
-            Output('invalid-channels-thermetry', 'children')
+            Output('invalid-channels-thermetry', 'children'),
+            Output('thermetry-refresh-state', 'data'),
         ],
         Input('thermetry-apply-btn', 'n_clicks'),
         [
@@ -67,27 +69,74 @@ def thermetry_register_callbacks(app):
             State('thermetry-date-picker-range', 'end_date'),
             State('hours-dropdown-thermetry', 'value'),
             State('plot-options-thermetry', 'value'),
-            State('split-value-thermetry', 'value'),],
+            State('split-value-thermetry', 'value'),
+            State('graph-width', 'data'),],
     )
-    def update_thermetry_plot(n, start_date, end_date, hours, options, split_value):
+    @cached_result('thermetry')
+    def update_thermetry_plot(n, start_date, end_date, hours, options, split_value, graph_width):
         if n is None:
             raise PreventUpdate
+        from data_files.toltec.thermetry_file import ToltecThermetryFile
+        from utils.plot_utils import update_plot, target_points
+        from utils.data_utils import get_files, get_file_index, get_time_window, window_dates
+        from utils.rollup_store import use_rollups, get_rollup_plot_data, get_rollup_store
+        from utils.day_cache import day_cache_enabled, load_plot_data
+        from utils.file_cache import open_data_file
+        from utils.live_tail import live_tail_enabled, get_live_tail
+        from utils.merge_utils import merge_plot_data
+        from utils.auto_refresh import refresh_state
+
+        window = get_time_window('thermetry', hours, start_date, end_date)
+        if use_rollups('thermetry', window):
+            # Channels without data in the window, from the index as on the raw file path
+            coverage = get_file_index().channel_coverage('thermetry', *window)
+            data = _covered_channels(get_rollup_plot_data('thermetry', *window, target_points(graph_width)), coverage)
+            fig = update_plot('Thermetry', data, hours, options, split_value)
+            if coverage:
+                invalid_channels = {channel for channel, has_data in coverage.items() if not has_data}
+            else:
+                invalid_channels = set(get_rollup_store().channels('thermetry'))
+            invalid_channels -= {trace['name'] for trace in data}
+            invalid_channels_display = dbc.Alert(
+                f"Invalid Channels: {', '.join(sorted(invalid_channels))}", color="warning"
+            ) if invalid_channels else None
+            return fig, invalid_channels_display, None
+        if day_cache_enabled() and window is not None:
+            data, all_channels = load_plot_data('thermetry', *window)
+            coverage = get_file_index().channel_coverage('thermetry', *window)
+            data = _covered_channels(data, coverage)
+            # The 'Last N hours' views include the samples of the live file, as on the raw file path
+            if hours > 0 and live_tail_enabled():
+                data.extend(get_live_tail('thermetry').plot_data(*window))
+            data = merge_plot_data(data, window)
+            fig = update_plot('Thermetry', data, hours, options, split_value, target_points(graph_width))
+            if coverage:
+                invalid_channels = {channel for channel, has_data in coverage.items() if not has_data}
+            else:
+                invalid_channels = set(all_channels)
+            invalid_channels -= {trace['name'] for trace in data}
+            invalid_channels_display = dbc.Alert(
+                f"Invalid Channels: {', '.join(sorted(invalid_channels))}", color="warning"
+            ) if invalid_channels else None
+            return fig, invalid_channels_display, refresh_state(fig, hours, window, target_points(graph_width))
         files = get_files('thermetry', hours, start_date, end_date)
+        index = get_file_index()
         data = []
         potentially_invalid_channels = set()  # Start by assuming all channels might be invalid
         verified_valid_channels = set()  # Track channels that are valid in at least one file
 
         try:
             for file in files:
-                # Read the file from the fixed directory
+                # Read the file from the fixed directory, skipping the channels the index knows are empty
                 file_path = os.path.join(FIXED_DIRECTORY, file)
-                thermetry_file = ToltecThermetryFile(file_path)
+                thermetry_file = open_data_file(ToltecThermetryFile, file_path, window,
+                                                index.empty_variables('thermetry', file))
 
                 if not hasattr(thermetry_file, 'get_plot_data'):
                     raise AttributeError("ToltecThermetryFile object does not have 'get_plot_data' method")
 
-                # Get plot data and invalid channels for the current file
-                file_plot_data, file_invalid_channels = thermetry_file.get_plot_data(hours, start_date, end_date)
+                # Get plot data and invalid channels for the current file, over the window every file shares
+                file_plot_data, file_invalid_channels = thermetry_file.get_plot_data(0, *window_dates(window))
 
                 if not file_plot_data:
                     print(f"No valid plot data available for file: {file}")
@@ -104,17 +153,29 @@ def thermetry_register_callbacks(app):
                 verified_valid_channels.update(valid_channels_in_file)
                 potentially_invalid_channels.difference_update(valid_channels_in_file)
 
+            # Merge in the samples of the live file for the 'Last N hours' views
+            if hours > 0 and live_tail_enabled() and window is not None:
+                live_data = get_live_tail('thermetry').plot_data(*window)
+                data.extend(live_data)
+                verified_valid_channels.update(trace['name'] for trace in live_data)
+
+            # One contiguous trace per channel across all files
+            data = merge_plot_data(data, window)
+
             # Generate the plot with accumulated data
-            fig = update_plot('Thermetry', data, hours, options, split_value)
+            fig = update_plot('Thermetry', data, hours, options, split_value, target_points(graph_width))
 
-            # Display only channels that are invalid across all files
+            # Display only channels that are invalid across all files, from the index when it describes them
+            coverage = index.channel_coverage('thermetry', *window) if window is not None else {}
+            if coverage:
+                potentially_invalid_channels = {channel for channel, has_data in coverage.items() if not has_data}
             final_invalid_channels = potentially_invalid_channels - verified_valid_channels
             invalid_channels_display = dbc.Alert(
                 f"Invalid Channels: {', '.join(final_invalid_channels)}",
                 color="warning" if final_invalid_channels else "success"
             ) if final_invalid_channels else None
 
-            return fig, invalid_channels_display
+            return fig, invalid_channels_display, refresh_state(fig, hours, window, target_points(graph_width))
 
         except Exception as e:
             error_message = f"Error processing files: {str(e)}"
@@ -122,7 +183,9 @@ def thermetry_register_callbacks(app):
             print(traceback.format_exc())  # This will print the full traceback
             error_fig = go.Figure().add_annotation(text=error_message, showarrow=False, font=dict(size=20, color="red"))
             error_alert = dbc.Alert(error_message, color="danger")
-            return error_fig, error_alert
+            return error_fig, error_alert, None
+
+    auto_refresh_register_callbacks(app, 'thermetry')
     # @app.callback(
     #     [
     #         Output('thermetry-plot', 'figure'),
@@ -193,7 +256,7 @@ def thermetry_register_callbacks(app):
     #             )
     #
     #         # Generate plot with accumulated data
-    #         fig = update_plot('Thermetry', data, hours, options, split_value)
+    #         fig = update_plot('Thermetry', data, hours, options, split_value, target_points(graph_width))
     #
     #         # Create status message
     #         final_invalid_channels = potentially_invalid_channels - verified_valid_channels
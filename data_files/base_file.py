@@ -1,21 +1,74 @@
 import netCDF4
 import os
+import numpy as np
+import pandas as pd
+from utils.nc_utils import nc_lock, time_slice
 # base file class
 class ToltecBaseFile:
-    def __init__(self, file_input):
+    # Whether variables are read from the open netCDF file after construction
+    LAZY_VARIABLES = False
+
+    # Time variables that index the records of the file
+    TIME_VARIABLES = []
+
+    def __init__(self, file_input, time_window=None, record_slices=None, skip_variables=()):
         self.nc = None
         self.data = {}
+        # (start_time, end_time) in epoch seconds; when set only records inside it are read
+        self.time_window = time_window
+        # {time_var: slice} of records to read, e.g. only those appended to a live file
+        self.record_slices = record_slices
+        # Variables the file index knows hold no usable data, which are not read
+        self.skip_variables = set(skip_variables)
 
-        if isinstance(file_input, str) and os.path.isfile(file_input):
-            self.nc = netCDF4.Dataset(file_input)
-        else:
+        if not (isinstance(file_input, str) and os.path.isfile(file_input)):
             raise ValueError("Invalid file input. Must be a valid file path.")
 
-        self._read_variables()
+        with nc_lock:
+            self.nc = netCDF4.Dataset(file_input)
+            self._read_variables()
 
     def _read_variables(self):
         raise NotImplementedError("Subclasses must implement this method")
 
-    def __del__(self):
+    def _window_slice(self, time_var):
+        """Index slice of the records of time_var inside self.time_window (all records without one)"""
+        if self.record_slices is not None:
+            return self.record_slices.get(time_var, slice(0, 0))
+        if self.time_window is None:
+            return slice(None)
+        window_slice = time_slice(self.nc.variables[time_var], *self.time_window)
+        return slice(None) if window_slice is None else window_slice
+
+    def get_all_plot_data(self):
+        """Plot data for every channel over the whole file, as [{'x', 'y', 'name'}, ...]"""
+        raise NotImplementedError("Subclasses must implement this method")
+
+    def memory_usage(self):
+        """Bytes held by the decoded DataFrames and arrays of this file, each shared array counted once"""
+        seen = set()
+
+        def nbytes(value):
+            if isinstance(value, (pd.DataFrame, pd.Series, pd.Index, np.ndarray)):
+                if id(value) in seen:
+                    return 0
+                seen.add(id(value))
+            if isinstance(value, (pd.DataFrame, pd.Series)):
+                return int(np.sum(value.memory_usage(deep=True)))
+            if isinstance(value, (pd.Index, np.ndarray)):
+                return int(value.nbytes)
+            if isinstance(value, dict):
+                return sum(nbytes(v) for v in value.values())
+            if isinstance(value, (list, tuple)):
+                return sum(nbytes(v) for v in value)
+            return 0
+        return sum(nbytes(value) for value in vars(self).values())
+
+    def close(self):
         if self.nc:
-            self.nc.close()
\ No newline at end of file
+            with nc_lock:
+                self.nc.close()
+            self.nc = None
+
+    def __del__(self):
+        self.close()
\ No newline at end of file
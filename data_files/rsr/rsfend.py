@@ -6,19 +6,21 @@ from utils.data_utils import filter_dataframe_by_time
 
 class RsFendFile(ToltecBaseFile):
     BASE_NAME = 'Data.Rsfend.'
+    TIME_VARIABLES = [BASE_NAME + 'Time']
     DATA_KEYS = [
         'ColdPlateTemp', 'RotatorCDTemp', 'MmicAPrimaryTemp', '80KCharcoalPlateTemp',
         '20KCharcoalPlateTemp', 'SolenoidValveTemp', 'OpticsTemp', 'CompressorTemp']
     def _read_variables(self):
         try:
             self.df = pd.DataFrame()
+            records = self._window_slice(f'{self.BASE_NAME}Time')
             for var in self.DATA_KEYS:
                 full_var_name = self.BASE_NAME + var
                 if full_var_name in self.nc.variables:
-                    self.df[var] = self.nc.variables[full_var_name][:]
+                    self.df[var] = self.nc.variables[full_var_name][records]
                 else:
                     print(f"Variable {full_var_name} not found in the netCDF file.")
-            self.df['time'] = pd.to_datetime(self.nc.variables[f'{self.BASE_NAME}Time'][:], unit='s', utc=True)
+            self.df['time'] = pd.to_datetime(self.nc.variables[f'{self.BASE_NAME}Time'][records], unit='s', utc=True)
             self.df = self.df.dropna()
         except Exception as e:
             print(f"Error reading rsfend variables: {e}")
@@ -46,4 +48,7 @@ class RsFendFile(ToltecBaseFile):
             }
             for key in self.DATA_KEYS if key in filtered_df.columns
         ]
-        return plot_data
\ No newline at end of file
+        return plot_data
+
+    def get_all_plot_data(self):
+        return self.getData(None, None, 0)
\ No newline at end of file
@@ -3,14 +3,17 @@ import pandas as pd
 from data_files.base_file import ToltecBaseFile
 
 class ToltecCryocmpFile(ToltecBaseFile):
+    TIME_VARIABLES = ['Data.ToltecCryocmp.Time']
+
     def _read_variables(self):
         try:
             base_name = 'Data.ToltecCryocmp.'
             self.df = pd.DataFrame()
+            records = self._window_slice(base_name + 'Time')
             for var in ['Time', 'CoolInTemp', 'CoolOutTemp', 'OilTemp', 'Energized']:
                 full_name = base_name + var
                 if full_name in self.nc.variables:
-                    self.df[var] = self.nc.variables[full_name][:]
+                    self.df[var] = self.nc.variables[full_name][records]
             # filter out NaN values
             self.df = self.df.dropna()
             # Set 'time' as datetime from 'Time' and multiply 'Energized' by 10
@@ -36,7 +39,7 @@ class ToltecCryocmpFile(ToltecBaseFile):
             end_date = pd.to_datetime(end_date, utc=True)
             filtered_df = self.df[(self.df['time'] >= start_date) & (self.df['time'] <= end_date)]
         else:
-            filtered_df = self.df
+            filtered_df = self.df.copy()
 
         # Convert temperatures to Fahrenheit
         for temp_var in ['CoolOutTemp', 'CoolInTemp', 'OilTemp']:
@@ -55,4 +58,7 @@ class ToltecCryocmpFile(ToltecBaseFile):
             for key in data_keys if key in filtered_df.columns
         ]
 
-        return plot_data
\ No newline at end of file
+        return plot_data
+
+    def get_all_plot_data(self):
+        return self.getData(None, None, 0)
\ No newline at end of file
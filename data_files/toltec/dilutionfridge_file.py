@@ -1,89 +1,171 @@
+import multiprocessing
+import os
 from datetime import timedelta
 
+import netCDF4
 import pandas as pd
 
 from data_files.base_file import ToltecBaseFile
+from utils.file_cache import column_cache_enabled, get_column_cache
+from utils.nc_utils import chars_equal, epoch_ns, nc_lock
+from utils.single_flight import single_flight
 
 import numpy as np
-from functools import lru_cache
 
 class ToltecDilutionFridgeFile(ToltecBaseFile):
-    @lru_cache(maxsize=1)
-    def _read_variables(self):
-        self.df = pd.DataFrame()
+    # getData reads the variables of each selection on first use, reopening the file if it was closed
+    LAZY_VARIABLES = True
+    BASE_NAME = 'Data.ToltecDilutionFridge.'
+    TIME_VARIABLES = ['Data.ToltecDilutionFridge.SampleTime']
+
+    # Variables plotted for each data selection
+    SELECTION_KEYS = {
+        'Comp': ['StsDevC1PtcSigWit', 'StsDevC1PtcSigWot', 'StsDevC1PtcSigOilt', 'Energized'],
+        'Pump': ['StsDevP1PresSigPres'],
+        'Temp': [f'StsDevT{i}TempSigTemp' for i in range(1, 17)],
+        'All': [
+                   'StsDevP1PresSigPres', 'StsDevP2PresSigPres', 'StsDevP3PresSigPres',
+                   'StsDevP4PresSigPres', 'StsDevP5PresSigPres', 'StsDevP6PresSigPres',
+                   'StsDevTurb1PumpSigPowr', 'StsDevTurb1PumpSigSpd',
+                   'StsDevC1PtcSigWit', 'StsDevC1PtcSigWot', 'StsDevC1PtcSigOilt',
+                   'StsDevC1PtcSigHt', 'StsDevC1PtcSigHlp', 'StsDevC1PtcSigHhp',
+                   'StsDevH1HtrSigPowr', 'StsDevH2HtrSigPowr', 'StsDevH3HtrSigPowr', 'Energized'
+               ] + [f'StsDevT{i}TempSigTemp' for i in range(1, 17)] + [f'StsDevT{i}TempSigRes' for i in range(1, 17)],
+    }
+
+    # Label mapping for plot legend
+    LABEL_MAPPING = {
+        'StsDevP1PresSigPres': 'P1', 'StsDevP2PresSigPres': 'P2', 'StsDevP3PresSigPres': 'P3',
+        'StsDevP4PresSigPres': 'P4', 'StsDevP5PresSigPres': 'P5', 'StsDevP6PresSigPres': 'P6',
+        'StsDevTurb1PumpSigPowr': 'Power', 'StsDevTurb1PumpSigSpd': 'Speed',
+        'StsDevC1PtcSigWit': 'H2O In Temp', 'StsDevC1PtcSigWot': 'H2O Out Temp',
+        'StsDevC1PtcSigOilt': 'Oil Temp', 'StsDevC1PtcSigHt': 'Helium Temp',
+        'StsDevC1PtcSigHlp': 'Low Pressure', 'StsDevC1PtcSigHhp': 'High Pressure',
+        'StsDevH1HtrSigPowr': 'Chamber', 'StsDevH2HtrSigPowr': 'Still', 'StsDevH3HtrSigPowr': 'H3'
+    }
+    LABEL_MAPPING.update({f'StsDevT{i}TempSigTemp': f'T{i}' for i in range(1, 17)})
+    LABEL_MAPPING.update({f'StsDevT{i}TempSigRes': f'R{i}' for i in range(1, 17)})
+
+    # Variables read for the keys that are not read under their own name
+    SOURCE_VARIABLES = {'Energized': 'StsDevC1PtcSigState'}
+
+    @classmethod
+    def labels_for(cls, data_selection):
+        """Legend labels of the traces plotted for data_selection"""
+        return [cls.LABEL_MAPPING.get(key, key) for key in cls.SELECTION_KEYS[data_selection]]
+
+    @classmethod
+    def variables_present(cls, nc):
+        """(legend label, netCDF variable) of every plotted key whose variable is in the file"""
         base_name = 'Data.ToltecDilutionFridge.'
+        present = []
+        for key in cls.SELECTION_KEYS['All']:
+            variable = base_name + cls.SOURCE_VARIABLES.get(key, key)
+            if variable in nc.variables:
+                present.append((cls.LABEL_MAPPING.get(key, key), variable))
+        return present
 
-        # Process 'time' column
-        time_data = self.nc.variables[base_name + 'SampleTime'][:]
-        self.df['time'] = pd.to_datetime(time_data, unit='s', utc=True)
-
-        # Process 'Energized' column if available in nc variables
-        if base_name + 'StsDevC1PtcSigState' in self.nc.variables:
-            state_data = self.nc.variables[base_name + 'StsDevC1PtcSigState'][:]
-            self.df['Energized'] = [
-                10 if b''.join(state).decode().rstrip('\x00').strip() == 'ON' else 0
-                for state in state_data
-            ]
-        else:
-            self.df['Energized'] = np.nan  # Fallback in case data is missing
+    def _read_variables(self):
+        # Only the records inside the requested time window are read, with explicit bounds
+        # so that a reopened file is read at the same records
+        time_var = self.BASE_NAME + 'SampleTime'
+        self.records = slice(*self._window_slice(time_var).indices(self.nc.variables[time_var].shape[0]))
+        self.file_path = self.nc.filepath()
+        self.variables = set(self.nc.variables)
+
+        # Whole-file reads of the request threads share their columns through the column cache,
+        # per version of the file; windowed and live-tail reads and scan workers keep their own
+        stat = os.stat(self.file_path)
+        self.column_key = (os.path.abspath(self.file_path), stat.st_size, stat.st_mtime_ns)
+        self.shared_columns = (column_cache_enabled() and self.time_window is None and self.record_slices is None
+                               and multiprocessing.parent_process() is None)
+        # Columns read by this reader when they are not shared
+        self.columns = {}
+
+    def _columns(self, keys):
+        """{key: values at self.records, or None if the file lacks it} of selection keys ('time' as epoch ns)"""
+        if not self.shared_columns:
+            missing = [key for key in keys if key not in self.columns]
+            if missing:
+                self.columns.update(self._read_columns(missing))
+            return {key: self.columns[key] for key in keys}
+
+        cache = get_column_cache()
+        columns = {key: cache.get(self.column_key + (key,)) for key in keys}
+        missing = tuple(key for key, column in columns.items() if column is None)
+        if missing:
+            # Threads asking for the same columns at once read them once
+            columns.update(single_flight.do(('columns', self.column_key, missing),
+                                            self._read_and_cache_columns, cache, missing))
+        return columns
+
+    def _read_and_cache_columns(self, cache, keys):
+        columns = self._read_columns(keys)
+        for key, column in columns.items():
+            if column is not None:
+                cache.put(self.column_key + (key,), column, column.nbytes)
+        return columns
+
+    def _source_variable(self, key):
+        if key == 'time':
+            return self.BASE_NAME + 'SampleTime'
+        return self.BASE_NAME + self.SOURCE_VARIABLES.get(key, key)
+
+    def _read_columns(self, keys):
+        """Read keys from the file, reopening it when it has been closed"""
+        columns = {key: None for key in keys}
+        to_read = [key for key in keys
+                   if self._source_variable(key) in self.variables and self._source_variable(key) not in self.skip_variables]
+        if to_read:
+            with nc_lock:
+                nc = self.nc
+                if nc is None:
+                    stat = os.stat(self.file_path)
+                    if (stat.st_size, stat.st_mtime_ns) != self.column_key[1:]:
+                        print(f"{self.file_path} changed since it was opened, not reading {', '.join(to_read)}")
+                        return columns
+                    nc = netCDF4.Dataset(self.file_path)
+                try:
+                    for key in to_read:
+                        columns[key] = self._read_column(nc, key)
+                finally:
+                    if nc is not self.nc:
+                        nc.close()
+        if 'Energized' in columns and columns['Energized'] is None:
+            # Fallback in case data is missing
+            columns['Energized'] = np.full(self.records.stop - self.records.start, np.nan)
+        return columns
+
+    def _read_column(self, nc, key):
+        variable = nc.variables[self._source_variable(key)]
+        if key == 'time':
+            return epoch_ns(np.ma.filled(variable[self.records], 0))
+        if key == 'Energized':
+            return np.where(chars_equal(variable[self.records], 'ON'), 10, 0)
+        return np.ma.filled(variable[self.records].astype(float), np.nan)
 
     def getData(self, data_selection, hours, start_date, end_date):
+        data_keys = self.SELECTION_KEYS[data_selection]
+        columns = self._columns(['time'] + data_keys)
+        if columns['time'] is None:
+            return []
+        times = pd.DatetimeIndex(columns['time'].view('datetime64[ns]'), tz='UTC')
 
-        if data_selection == 'Comp':
-            data_keys = ['StsDevC1PtcSigWit', 'StsDevC1PtcSigWot', 'StsDevC1PtcSigOilt', 'Energized']
-        elif data_selection == 'Pump':
-            data_keys = ['StsDevP1PresSigPres']
-        elif data_selection == 'Temp':
-            data_keys = [f'StsDevT{i}TempSigTemp' for i in range(1, 17)]
-        elif data_selection == 'All':
-            data_keys = [
-                            'StsDevP1PresSigPres', 'StsDevP2PresSigPres', 'StsDevP3PresSigPres',
-                            'StsDevP4PresSigPres', 'StsDevP5PresSigPres', 'StsDevP6PresSigPres',
-                            'StsDevTurb1PumpSigPowr', 'StsDevTurb1PumpSigSpd',
-                            'StsDevC1PtcSigWit', 'StsDevC1PtcSigWot', 'StsDevC1PtcSigOilt',
-                            'StsDevC1PtcSigHt', 'StsDevC1PtcSigHlp', 'StsDevC1PtcSigHhp',
-                            'StsDevH1HtrSigPowr', 'StsDevH2HtrSigPowr', 'StsDevH3HtrSigPowr','Energized'
-                        ] + [f'StsDevT{i}TempSigTemp' for i in range(1, 17)] + [f'StsDevT{i}TempSigRes' for i in
-                                                                                range(1, 17)]
-
-        # Load variables into DataFrame only if they are in data_keys
-        for var in data_keys:
-            full_name = f'Data.ToltecDilutionFridge.{var}'
-            if full_name in self.nc.variables:
-                self.df[var] = self.nc.variables[full_name][:]
-
-
-        # Filter the DataFrame by recent hours or start_date/end_date
-        if hours > 0:
-            recent_time = self.df['time'].iloc[-1] - timedelta(hours=hours)
-            filtered_df = self.df[self.df['time'] >= recent_time]
+        # Filter by recent hours or start_date/end_date
+        if hours > 0 and len(times):
+            selected = times >= times[-1] - timedelta(hours=hours)
         elif start_date and end_date:
-            start_date = pd.to_datetime(start_date, utc=True)
-            end_date = pd.to_datetime(end_date, utc=True)
-            filtered_df = self.df[(self.df['time'] >= start_date) & (self.df['time'] <= end_date)]
+            selected = (times >= pd.to_datetime(start_date, utc=True)) & (times <= pd.to_datetime(end_date, utc=True))
         else:
-            filtered_df = self.df
-
-        # Label mapping for plot legend
-        label_mapping = {
-            'StsDevP1PresSigPres': 'P1', 'StsDevP2PresSigPres': 'P2', 'StsDevP3PresSigPres': 'P3',
-            'StsDevP4PresSigPres': 'P4', 'StsDevP5PresSigPres': 'P5', 'StsDevP6PresSigPres': 'P6',
-            'StsDevTurb1PumpSigPowr': 'Power', 'StsDevTurb1PumpSigSpd': 'Speed',
-            'StsDevC1PtcSigWit': 'H2O In Temp', 'StsDevC1PtcSigWot': 'H2O Out Temp',
-            'StsDevC1PtcSigOilt': 'Oil Temp', 'StsDevC1PtcSigHt': 'Helium Temp',
-            'StsDevC1PtcSigHlp': 'Low Pressure', 'StsDevC1PtcSigHhp': 'High Pressure',
-            'StsDevH1HtrSigPowr': 'Chamber', 'StsDevH2HtrSigPowr': 'Still', 'StsDevH3HtrSigPowr': 'H3'
-        }
-        label_mapping.update({f'StsDevT{i}TempSigTemp': f'T{i}' for i in range(1, 17)})
-        label_mapping.update({f'StsDevT{i}TempSigRes': f'R{i}' for i in range(1, 17)})
-
-        plot_data = [
-            {
-                'x': filtered_df['time'],
-                'y': filtered_df[key],
-                'name': label_mapping.get(key,key)
-            }
-            for key in data_keys if key in filtered_df.columns
-]
+            selected = slice(None)
+
+        plot_data = []
+        for key in data_keys:
+            column = columns[key]
+            if column is not None:
+                plot_data.append({'x': times[selected], 'y': column[selected], 'name': self.LABEL_MAPPING.get(key, key)})
         return plot_data
 
+    def get_all_plot_data(self):
+        return self.getData('All', 0, None, None)
+
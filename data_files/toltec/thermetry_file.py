@@ -1,146 +1,163 @@
+import numpy as np
 import pandas as pd
 from data_files.base_file import ToltecBaseFile
+from utils.nc_utils import decode_chars, epoch_ns
+
+CHANNEL_COUNT = 16
+
 
 class ToltecThermetryFile(ToltecBaseFile):
+    TIME_VARIABLES = [f'Data.ToltecThermetry.Time{i + 1}' for i in range(CHANNEL_COUNT)]
+
     def _read_variables(self):
-        """Read and process thermetry data with optimized catching"""
+        """
+        Read all channels into one layout: a sorted int64 epoch-nanosecond time array
+        per channel (the same array object when channels share their times), a float32
+        value matrix with one zero-padded row per channel, and the number of valid
+        samples of each row
+        """
+        self.chanLabels = [f'Chan{i + 1}' for i in range(CHANNEL_COUNT)]
+        self.times = [np.empty(0, dtype=np.int64)] * CHANNEL_COUNT
+        self.values = np.empty((CHANNEL_COUNT, 0), dtype=np.float32)
+        self.lengths = np.zeros(CHANNEL_COUNT, dtype=np.int64)
         try:
-            variables = self.nc.variables.keys()
-            self.dataframes = {}
-
             # Process channel labels once
-            self.chanLabels = self._get_channel_labels(variables)
+            self.chanLabels = self.channel_labels(self.nc)
 
             # Process all channels
-            self._process_channels(variables)
+            self._process_channels(self.nc.variables.keys())
 
         except Exception as e:
             print(f"Error in read_variables: {e}")
-            self.dataframes = {label: pd.DataFrame() for label in self.chanLabels}
+            self.lengths[:] = 0
 
-    def _get_channel_labels(self, variables):
+    @staticmethod
+    def channel_labels(nc):
         """Get channel labels with efficient processing"""
         try:
-            if 'Header.ToltecThermetry.ChanLabel' in variables:
-                nc_labels = self.nc.variables['Header.ToltecThermetry.ChanLabel'][:]
-                decoded_labels = [b''.join(label).strip().decode() for label in nc_labels]
+            if 'Header.ToltecThermetry.ChanLabel' in nc.variables:
+                decoded_labels = decode_chars(nc.variables['Header.ToltecThermetry.ChanLabel'][:])
                 return [f'Chan{i + 1} - {label}' for i, label in enumerate(decoded_labels)]
 
-            return [f'Chan{i + 1}' for i in range(16)]
+            return [f'Chan{i + 1}' for i in range(CHANNEL_COUNT)]
 
         except Exception as e:
             print(f"Error processing channel labels: {e}")
-            return [f'Chan{i + 1}' for i in range(16)]
+            return [f'Chan{i + 1}' for i in range(CHANNEL_COUNT)]
 
     def _process_channels(self, variables):
-        """Process all channels efficiently"""
-        for i in range(16):
+        """Read every channel's valid samples, then pack the values into the matrix"""
+        channel_values = [np.empty(0, dtype=np.float32)] * CHANNEL_COUNT
+        for i in range(CHANNEL_COUNT):
             time_var = f'Data.ToltecThermetry.Time{i + 1}'
             temp_var = f'Data.ToltecThermetry.Temperature{i + 1}'
 
             if time_var not in variables or temp_var not in variables:
                 print(f"Warning: Variables {time_var} or {temp_var} not found")
-                self.dataframes[self.chanLabels[i]] = pd.DataFrame()
+                continue
+
+            if time_var in self.skip_variables:
                 continue
 
             try:
-                df = self._create_channel_dataframe(time_var, temp_var)
-                self.dataframes[self.chanLabels[i]] = df
+                self.times[i], channel_values[i] = self._read_channel(time_var, temp_var)
+                # Channels sampled together share one time array
+                for j in range(i):
+                    if np.array_equal(self.times[j], self.times[i]):
+                        self.times[i] = self.times[j]
+                        break
             except Exception as e:
                 print(f"Error processing channel {i + 1}: {e}")
-                self.dataframes[self.chanLabels[i]] = pd.DataFrame()
+                self.times[i], channel_values[i] = np.empty(0, dtype=np.int64), np.empty(0, dtype=np.float32)
 
-    def _create_channel_dataframe(self, time_var, temp_var):
-        """Create DataFrame for a single channel with optimized processing"""
-        # Get data from netCDF
-        time_data = self.nc.variables[time_var][:]
-        temp_data = self.nc.variables[temp_var][:]
+        self.lengths = np.array([len(v) for v in channel_values], dtype=np.int64)
+        self.values = np.zeros((CHANNEL_COUNT, self.lengths.max(initial=0)), dtype=np.float32)
+        for i, values in enumerate(channel_values):
+            self.values[i, :len(values)] = values
+
+    def _read_channel(self, time_var, temp_var):
+        """Valid samples of one channel as sorted (epoch ns, float32 values)"""
+        # Get data from netCDF, only inside the requested time window
+        records = self._window_slice(time_var)
+        time_data = np.ma.filled(self.nc.variables[time_var][records], 0)
+        temp_data = np.ma.filled(self.nc.variables[temp_var][records].astype(np.float32), np.nan)
 
         # Filter invalid timestamps efficiently
         valid_mask = time_data > 0
+        times = epoch_ns(time_data[valid_mask])
+        values = temp_data[valid_mask]
 
-        # Return empty DataFrame if no valid data
-        if not valid_mask.any():
-            return pd.DataFrame()
+        if len(times) > 1 and (np.diff(times) < 0).any():
+            order = np.argsort(times, kind='stable')
+            times, values = times[order], values[order]
+        return times, values
 
-        # Create DataFrame only with valid data
-        df = pd.DataFrame({
-            'timestamp': pd.to_datetime(time_data[valid_mask], unit='s'),
-            'temperature': temp_data[valid_mask]
-        })
+    def _channel(self, i, lo=0, hi=None):
+        """Samples [lo, hi) of channel i as (times, values) views"""
+        hi = self.lengths[i] if hi is None else hi
+        return self.times[i][lo:hi], self.values[i, lo:hi]
 
-        # Set index if we have valid data
-        if not df.empty:
-            df.set_index('timestamp', inplace=True)
-        return df
+    def _trace(self, i, lo=0, hi=None):
+        times, values = self._channel(i, lo, hi)
+        return {'x': pd.DatetimeIndex(times.view('datetime64[ns]')), 'y': values, 'name': self.chanLabels[i]}
 
     def get_max_min_time(self):
         """Get the maximum and minimum time for all channels"""
-        max_time = pd.Timestamp.min
-        min_time = pd.Timestamp.max
-
-        for df in self.dataframes.values():
-            if not df.empty:
-                max_time = max(max_time, df.index.max())
-                min_time = min(min_time, df.index.min())
-
-        return min_time.date(), max_time.date()
-
+        valid = [i for i in range(CHANNEL_COUNT) if self.lengths[i]]
+        if not valid:
+            return pd.Timestamp.max.date(), pd.Timestamp.min.date()
+        min_time = min(self.times[i][0] for i in valid)
+        max_time = max(self.times[i][self.lengths[i] - 1] for i in valid)
+        return pd.Timestamp(min_time).date(), pd.Timestamp(max_time).date()
 
     def get_plot_data(self, hours, start_date, end_date):
-        """Get plot data with optimized time range filtering"""
+        """Get plot data with one binary search per channel and window end"""
         plot_data = []
         invalid_channels = []
 
         try:
-            # Get valid dataframes efficiently
-            valid_dfs = {label: df for label, df in self.dataframes.items() if not df.empty}
-
-            if not valid_dfs:
-                return [], list(self.dataframes.keys())
+            if not self.lengths.any():
+                return [], list(self.chanLabels)
 
             # Calculate time range once
-            time_range = self._calculate_time_range(valid_dfs, hours,start_date, end_date)
+            time_range = self._calculate_time_range(hours, start_date, end_date)
             if time_range is None:
-                return [], list(self.dataframes.keys())
+                return [], list(self.chanLabels)
 
-            start_time, end_time = time_range
+            start_ns, end_ns = time_range
 
             # Process each channel efficiently
-            for channel_label, df in self.dataframes.items():
-                if df.empty:
-                    invalid_channels.append(channel_label)
-                    continue
-
-                # Use efficient boolean indexing
-                filtered_data = df[start_time:end_time]
+            for i, channel_label in enumerate(self.chanLabels):
+                times, _ = self._channel(i)
+                lo = np.searchsorted(times, start_ns, side='left')
+                hi = np.searchsorted(times, end_ns, side='right')
 
-                if filtered_data.empty:
+                if lo == hi:
                     invalid_channels.append(channel_label)
                     continue
 
-                plot_data.append({
-                    'x': filtered_data.index,
-                    'y': filtered_data['temperature'].values,
-                    'name': channel_label
-                })
+                plot_data.append(self._trace(i, lo, hi))
 
         except Exception as e:
             print(f"Error in get_plot_data: {e}")
-            return [], list(self.dataframes.keys())
+            return [], list(self.chanLabels)
 
         return plot_data, invalid_channels
 
-    def _calculate_time_range(self, valid_dfs, hours, start_date, end_date):
-        """Calculate time range for plotting efficiently"""
+    def get_all_plot_data(self):
+        """Get plot data for every valid channel over the whole file"""
+        return [self._trace(i) for i in range(CHANNEL_COUNT) if self.lengths[i]]
+
+    def _calculate_time_range(self, hours, start_date, end_date):
+        """Calculate the plotted time range as epoch nanoseconds"""
         try:
             if hours > 0:
-                end_time = max(df.index.max() for df in valid_dfs.values())
-                start_time = end_time - pd.Timedelta(hours=hours)
+                end_ns = max(int(self.times[i][self.lengths[i] - 1]) for i in range(CHANNEL_COUNT) if self.lengths[i])
+                start_ns = end_ns - int(hours * 3600 * 10**9)
             else:
-                start_time = pd.Timestamp(start_date)
-                end_time = pd.Timestamp(end_date)
-            return start_time, end_time
+                start_ns = pd.Timestamp(start_date).value
+                end_ns = pd.Timestamp(end_date).value
+            return start_ns, end_ns
         except Exception as e:
             print(f"Error calculating time range: {e}")
-            return None
\ No newline at end of file
+            return None
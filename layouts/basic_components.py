@@ -68,6 +68,13 @@ def split_value(id_prefix):
         ))
     ])
 
+def auto_refresh(id_prefix):
+    return dbc.Row([
+        dbc.Col(dbc.Switch(id=f'auto-refresh-{id_prefix}', label='Auto Refresh', value=False), width='auto'),
+        dcc.Interval(id=f'{id_prefix}-refresh-interval', disabled=True),
+        dcc.Store(id=f'{id_prefix}-refresh-state'),
+    ], className='mt-2')
+
 def invalid_channels(id_prefix):
     return html.Div(id=f'invalid-channels-{id_prefix}', className='mt-3')
 
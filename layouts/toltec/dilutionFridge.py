@@ -6,7 +6,7 @@ from layouts import basic_components as bc
 def create_dilutionFridge_layout():
     # Define options for the data selection RadioItems to avoid repetition
     data_selection_options = [
-        {'label': 'All', 'value': 'all'},
+        {'label': 'All', 'value': 'All'},
         {'label': 'Comp', 'value': 'Comp'},
         {'label': 'Pump', 'value': 'Pump'},
         {'label': 'Temp', 'value': 'Temp'}
@@ -31,7 +31,8 @@ def create_dilutionFridge_layout():
                     ), width='auto'
                 ),
 
-                dbc.Col(bc.apply_button('dilutionFridge'))
+                dbc.Col(bc.apply_button('dilutionFridge')),
+                dbc.Col(bc.auto_refresh('dilutionFridge'), width='auto')
             ])
         ]),
 
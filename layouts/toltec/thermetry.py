@@ -13,7 +13,8 @@ def create_thermetry_layout():
                 ], width='auto'),
                 dbc.Col(bc.plot_options('thermetry'), width='auto'),
                 dbc.Col(bc.split_value('thermetry'), width='auto'),
-                dbc.Col(bc.apply_button('thermetry'), width='auto')
+                dbc.Col(bc.apply_button('thermetry'), width='auto'),
+                dbc.Col(bc.auto_refresh('thermetry'), width='auto')
             ],),
             html.Div(id='invalid-channels-thermetry', className='align-items-center mt-3 mb-3')
         ]),
@@ -0,0 +1,118 @@
+import base64
+import math
+import os
+
+import numpy as np
+import pandas as pd
+
+from utils.data_utils import load_config, fixed_directories, get_file_index
+from utils.file_cache import open_data_file
+from utils.live_tail import live_tail_enabled, get_live_tail
+from utils.merge_utils import merge_plot_data, to_ns
+from utils.plot_utils import decimate
+from utils.rollup_store import reader_class
+
+config_path = "./config.yaml"
+config = load_config(config_path)
+auto_refresh_config = config.get('auto_refresh', {})
+
+REFRESH_SECONDS = auto_refresh_config.get('interval_seconds', 10)
+# The plotted window is tracked as this many chunks of points; whole chunks are trimmed as it rolls
+WINDOW_CHUNKS = auto_refresh_config.get('window_chunks', 20)
+
+
+def _epoch_seconds(x):
+    if isinstance(x, dict):
+        # Typed array of epoch milliseconds, see plot_utils.encode_figure
+        return np.frombuffer(base64.b64decode(x['bdata']), dtype=np.dtype(x['dtype']).newbyteorder('<')) / 1000
+    return pd.to_datetime(pd.Index(np.asarray(x)), utc=True).as_unit('ns').asi8 / 10**9
+
+
+def refresh_state(fig, hours, window, max_points):
+    """
+    Client-side state of a freshly built 'Last N hours' figure for auto-refresh:
+    the trace names in figure order, the last time each trace has seen and how
+    many of its points fall in each chunk of the window.
+    Returns None for figures that cannot be auto-refreshed (custom ranges, empty figures).
+    """
+    if hours <= 0 or window is None or not fig['data']:
+        return None
+    edges = np.linspace(window[0], window[1], WINDOW_CHUNKS + 1)
+    names, last, chunks = [], [], []
+    for trace in fig['data']:
+        if trace['x'] is None or len(trace['x']) == 0:
+            return None
+        times = np.clip(_epoch_seconds(trace['x']), window[0], window[1])
+        counts = np.histogram(times, edges)[0]
+        names.append(trace['name'])
+        last.append(float(times.max()))
+        chunks.append([[float(end), int(count)] for end, count in zip(edges[1:], counts)])
+    return {'hours': hours, 'end_time': float(window[1]), 'max_points': max_points,
+            'names': names, 'last': last, 'chunks': chunks}
+
+
+def recent_plot_data(id_prefix, start_time):
+    """Samples newer than start_time, one trace per channel: archived files indexed since, then the live file."""
+    directory = fixed_directories[id_prefix]
+    index = get_file_index()
+    parts = []
+    for name in index.files_overlapping(id_prefix, start_time, math.inf):
+        try:
+            data_file = open_data_file(reader_class(id_prefix), os.path.join(directory, name), (start_time, math.inf),
+                                       index.empty_variables(id_prefix, name))
+            parts.extend(data_file.get_all_plot_data())
+        except Exception as e:
+            print(f"Error reading {name} for auto-refresh: {e}")
+    if live_tail_enabled():
+        parts.extend(get_live_tail(id_prefix).plot_data(start_time))
+    return merge_plot_data(parts, (start_time, None))
+
+
+def extend_data(id_prefix, state):
+    """
+    New samples for a figure described by refresh_state, as (extendData, new state).
+
+    Each trace gets the samples after the last time it has seen. The window then
+    rolls forward: chunks that fell out of it are dropped, and maxPoints trims
+    every trace to the points of the chunks that remain. Returns (None, state)
+    when nothing new has arrived.
+    """
+    plot_data = recent_plot_data(id_prefix, min(state['last']))
+    by_name = {trace['name']: trace for trace in plot_data}
+
+    new_x, new_y, last = [], [], list(state['last'])
+    end_time = state['end_time']
+    for i, name in enumerate(state['names']):
+        trace = by_name.get(name)
+        x, y = np.empty(0, dtype=np.int64), np.empty(0)
+        if trace is not None:
+            times = to_ns(trace['x'])
+            new = times > last[i] * 10**9
+            x, y = times[new], trace['y'][new]
+        if len(x):
+            last[i] = float(x[-1] / 10**9)
+            end_time = max(end_time, last[i])
+        new_x.append(x)
+        new_y.append(y)
+    if all(len(x) == 0 for x in new_x):
+        return None, state
+
+    window_seconds = state['hours'] * 3600
+    start_time = end_time - window_seconds
+    update_x, update_y, max_points, chunks = [], [], [], []
+    for x, y, trace_chunks, trace_last in zip(new_x, new_y, state['chunks'], last):
+        if len(x):
+            # Keep new samples at the density of the original figure
+            n_out = max(4, int(state['max_points'] * (x[-1] - x[0]) / 10**9 / window_seconds) + 1)
+            x, y = decimate(pd.DatetimeIndex(x.view('datetime64[ns]')), y, n_out)
+            trace_chunks = trace_chunks + [[trace_last, len(y)]]
+        trace_chunks = [chunk for chunk in trace_chunks if chunk[0] >= start_time]
+        chunks.append(trace_chunks)
+        max_points.append(max(1, sum(count for _, count in trace_chunks)))
+        # Epoch milliseconds, which date axes accept whether the figure was sent as strings or typed arrays
+        update_x.append((to_ns(x) / 1e6).tolist() if len(x) else [])
+        update_y.append(np.asarray(y, dtype=float).tolist())
+
+    new_state = {**state, 'end_time': end_time, 'last': last, 'chunks': chunks}
+    extend = [{'x': update_x, 'y': update_y}, list(range(len(update_x))), {'x': max_points, 'y': max_points}]
+    return extend, new_state
@@ -0,0 +1,10 @@
+import yaml
+
+
+def load_config(config_path):
+    try:
+        with open(config_path, 'r') as stream:
+            return yaml.safe_load(stream)
+    except yaml.YAMLError as exc:
+        print(exc)
+        return None
@@ -1,11 +1,17 @@
 import time
-from datetime import date
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from datetime import date, timedelta
 from pathlib import Path
 import os
+import netCDF4
 import pandas as pd
-import yaml
-import xarray as xr
 import pickle
+from utils.config_utils import load_config
+from utils.file_index import get_file_index
+from utils.nc_utils import nc_lock, scan_time, record_count, any_nonzero
+from data_files.toltec.thermetry_file import ToltecThermetryFile
+from data_files.toltec.dilutionfridge_file import ToltecDilutionFridgeFile
+from utils.single_flight import coalesce
 config_path = "./config.yaml"
 
 thermetry_invalid_files = [
@@ -18,20 +24,23 @@ thermetry_invalid_files = [
     'thermetry_2019-10-31_000001_00_1572550678.nc',
     'thermetry_2019-03-25_000001_00_1553536659.nc',
 ]
-def load_config(config_path):
-    try:
-        with open(config_path, 'r') as stream:
-            return yaml.safe_load(stream)
-    except yaml.YAMLError as exc:
-        print(exc)
-        return None
-
 config = load_config(config_path)
 fixed_directories = config['fixed_directories']
+# Number of worker processes used to scan uncached files (1 keeps the serial scan)
+scan_workers = max(1, int(config.get('scan_workers', 1)))
+# Write scanned files to the index in batches of this size so a long rebuild keeps its progress
+SCAN_SAVE_EVERY = 50
+EPOCH_DATE = date(1970, 1, 1)
+# Files re-checked for growth when the directory listing itself is unchanged
+RECENT_FILES_CHECKED = 2
+# Keep the multi-resolution rollups (utils/rollup_store.py) in step with the index
+rollups_enabled = bool(config.get('rollups', {}).get('enabled'))
+_rollups_checked = set()
 #fixed_directories = {'thermetry': '/home/lmt/data_lmt/thermetry', 'dilutionFridge': '/home/lmt/data_lmt/dilutionFridge', 'cryocmp': '/home/lmt/data_lmt/cryocmp', 'rsfend': '/home/lmt/data_lmt/rsfend'}
 def filter_dataframe_by_time(df, hours=0, start_date=None, end_date=None):
     """
     Filters a DataFrame by the most recent hours or a specified date range.
+    df itself is left unchanged, as it may belong to a reader shared through the file cache.
 
     Parameters:
     - df (pd.DataFrame): The DataFrame to filter, with a 'time' column in datetime format.
@@ -42,6 +51,7 @@ def filter_dataframe_by_time(df, hours=0, start_date=None, end_date=None):
     Returns:
     - filtered_df (pd.DataFrame): The filtered DataFrame.
     """
+    df = df.copy()
     df['time'] = pd.to_datetime(df['time'], utc=True)
 
     if hours > 0:
@@ -55,34 +65,171 @@ def filter_dataframe_by_time(df, hours=0, start_date=None, end_date=None):
 
     return df
 
-def load_cache(id_prefix):
-    """Load processed data cache from disk, or create a new one if not available."""
-    cache_file_path = Path(f'./cache/{id_prefix}.pkl')
+def to_epoch(timestamp):
+    """Convert a tz-naive UTC timestamp to epoch seconds."""
+    return pd.Timestamp(timestamp).value / 1e9
 
-    if cache_file_path.exists() and os.path.getsize(cache_file_path) > 0:
-        try:
-            with open(cache_file_path, 'rb') as f:
-                return pickle.load(f)
-        except EOFError:
-            print(f"Warning: Cache file {cache_file_path} is empty or corrupted. Recreating the cache.")
 
-    print(f"No cache found at {cache_file_path} or cache is empty. Recreating cache.")
-    return {}
+def from_epoch(seconds):
+    """Convert epoch seconds to a tz-naive UTC timestamp."""
+    return pd.Timestamp(seconds, unit='s')
 
-def save_cache(cache, id_prefix):
-    """Save the processed data cache to disk."""
+
+def window_dates(window):
+    """The (start, end) of a get_time_window window as timestamps, for the readers' date filters."""
+    return from_epoch(window[0]), from_epoch(window[1])
+
+
+def import_legacy_cache(id_prefix, index):
+    """Copy entries of the old ./cache/{id_prefix}.pkl cache into the file index, if there is one."""
     cache_file_path = Path(f'./cache/{id_prefix}.pkl')
+    if not cache_file_path.exists() or os.path.getsize(cache_file_path) == 0:
+        return
+
     try:
-        with cache_file_path.open('wb') as f:
-            pickle.dump(cache, f)
-        print(f"Cache saved to {cache_file_path}")
-    except Exception as e:
-        print(f"Error saving cache: {e}")
+        with open(cache_file_path, 'rb') as f:
+            cache = pickle.load(f)
+    except (EOFError, pickle.UnpicklingError) as e:
+        print(f"Warning: Cache file {cache_file_path} is corrupted, skipping import: {e}")
+        return
+
+    directory = Path(fixed_directories[id_prefix])
+    rows = []
+    for name, entry in cache.items():
+        file_path = directory / name
+        if not file_path.exists():
+            continue
+        rows.append((name, file_path.stat().st_size, entry['mtime'],
+                     to_epoch(entry['min_time']), to_epoch(entry['max_time']),
+                     [day.toordinal() for day in entry['available_days']], []))
+    index.upsert_many(id_prefix, rows)
+    print(f"Imported {len(rows)} entries from {cache_file_path} into the file index")
+
+
+def scan_files(file_paths, workers=None, func=None):
+    """
+    Run func (process_file by default) over file_paths, serially or on a bounded process pool.
+    Yields (file_path, result) as each file finishes, e.g. (file_path, (min_time, max_time, available_days, channels)),
+    with None as the result of a file whose worker failed.
+    """
+    func = func or process_file
+    workers = scan_workers if workers is None else max(1, workers)
+    if workers == 1 or len(file_paths) <= 1:
+        for file_path in file_paths:
+            yield file_path, func(str(file_path))
+        return
+
+    with ProcessPoolExecutor(max_workers=min(workers, len(file_paths))) as executor:
+        # The workers are forked while submitting, which must not happen while another thread is inside HDF5
+        with nc_lock:
+            futures = {executor.submit(func, str(file_path)): file_path for file_path in file_paths}
+        for future in as_completed(futures):
+            file_path = futures[future]
+            try:
+                yield file_path, future.result()
+            except Exception as e:
+                print(f"Error processing file {file_path}: {e}")
+                yield file_path, None
+
+
+def _list_directory(directory, id_prefix):
+    """Return {name: (size, mtime)} for the archived .nc files in directory."""
+    listing = {}
+    with os.scandir(directory) as entries:
+        for entry in entries:
+            if entry.name.endswith('.nc') and entry.name != f'{id_prefix}.nc' and entry.is_file():
+                stat = entry.stat()
+                listing[entry.name] = (stat.st_size, stat.st_mtime)
+    return listing
+
+
+@coalesce(lambda id_prefix, names=(): (id_prefix, tuple(sorted(names))))
+def refresh_index(id_prefix, names=()):
+    """
+    Bring the file index up to date with the instrument directory.
+    Concurrent refreshes of the same instrument run once and share the result.
+
+    Only new files and files whose size or mtime changed are scanned, and removed
+    files are dropped. When the directory mtime matches the last full listing, no
+    file was added, removed or renamed, so the listing is skipped and only the most
+    recently modified files, plus any explicitly given names, are re-checked.
+    Rollups of rescanned files are rebuilt when they are enabled.
+    Returns the number of files that were rescanned or removed.
+    """
+    directory = Path(fixed_directories[id_prefix])
+    index = get_file_index()
+    if index.is_empty(id_prefix):
+        import_legacy_cache(id_prefix, index)
+
+    directory_mtime = directory.stat().st_mtime_ns
+    indexed_files = index.file_stats(id_prefix)
+    full_listing = directory_mtime != index.directory_mtime(id_prefix)
+
+    if full_listing:
+        listing = _list_directory(directory, id_prefix)
+        removed_files = indexed_files.keys() - listing.keys()
+    else:
+        listing = {}
+        removed_files = set()
+        for name in set(names) | index.recently_modified(id_prefix, RECENT_FILES_CHECKED).keys():
+            try:
+                stat = (directory / name).stat()
+                listing[name] = (stat.st_size, stat.st_mtime)
+            except FileNotFoundError:
+                if name in indexed_files:
+                    removed_files.add(name)
+
+    changed_files = [directory / name for name, stat in listing.items() if indexed_files.get(name) != stat]
+    failed_files = []
+
+    if changed_files:
+        print(f"Scanning {len(changed_files)} new or changed files for {id_prefix} with {scan_workers} worker(s)")
+        rows = []
+        for file_path, result in scan_files(changed_files):
+            if result is None:
+                # No row is written, so the file is scanned again on the next refresh
+                failed_files.append(file_path.name)
+                continue
+            file_min_time, file_max_time, file_available_days, channels = result
+            size, mtime = listing[file_path.name]
+            if file_min_time is not None and file_max_time is not None:
+                rows.append((file_path.name, size, mtime,
+                             to_epoch(file_min_time), to_epoch(file_max_time),
+                             [day.toordinal() for day in file_available_days], channels))
+            else:
+                rows.append((file_path.name, size, mtime, None, None, [], channels))
+
+            if len(rows) >= SCAN_SAVE_EVERY:
+                index.upsert_many(id_prefix, rows)
+                rows = []
+
+        index.upsert_many(id_prefix, rows)
+
+    if removed_files:
+        print(f"Removing {len(removed_files)} deleted files from the {id_prefix} index")
+        index.remove(id_prefix, removed_files)
+
+    if failed_files:
+        print(f"Could not scan {len(failed_files)} {id_prefix} files, they are retried on the next refresh")
+        # Forget the directory mtime so the next refresh lists the directory and finds them again
+        index.set_directory_mtime(id_prefix, -1)
+    elif full_listing:
+        index.set_directory_mtime(id_prefix, directory_mtime)
 
+    changed = len(changed_files) - len(failed_files) + len(removed_files)
+    if rollups_enabled and (changed or id_prefix not in _rollups_checked):
+        # Imported here because rollup_store depends on this module and the data_files readers
+        from utils.rollup_store import schedule_rollups
+        # Built in the background, so callers waiting on this refresh do not wait for the rollups too
+        schedule_rollups(id_prefix)
+        _rollups_checked.add(id_prefix)
 
-def load_all_data(id_prefix):
+    return changed
+
+
+def load_all_data(id_prefix, refresh=True):
     """
-    Load and process all .nc files in the directory, using cache when possible.
+    Summarize the available data in the file index, refreshing it first unless refresh is False.
     Returns:
         tuple: (disabled_days, min_time, max_time)
     """
@@ -91,112 +238,114 @@ def load_all_data(id_prefix):
         print(f"Directory not found for {id_prefix}")
         return [], date.today(), date.today()  # Return today's date instead of None
 
-    processed_data_cache = load_cache(id_prefix)
-    min_time = pd.Timestamp.max.tz_localize(None)
-    max_time = pd.Timestamp.min.tz_localize(None)
-    available_days = set()
-    cache_updated = False
-
-    nc_files = [f for f in Path(directory).glob('*.nc')
-                if f.is_file() and f.name != f'{id_prefix}.nc']
+    index = get_file_index()
+    if refresh:
+        refresh_index(id_prefix)
 
-    if not nc_files:
-        print(f"No .nc files found in {directory}")
+    min_time, max_time = index.time_range(id_prefix)
+    if min_time is None or max_time is None:
+        print(f"No valid data found in {directory}")
         return [], date.today(), date.today()  # Return today's date instead of None
 
-    valid_data_found = False
+    # Convert to date objects for consistency
+    min_time = from_epoch(min_time).date()
+    max_time = from_epoch(max_time).date()
 
-    for file_path in nc_files:
-        if not file_path.exists():
-            continue
+    coverage = index.day_coverage(id_prefix)
+    disabled_days = [date.fromordinal(day)
+                     for day in coverage.missing(min_time.toordinal(), max_time.toordinal()).tolist()]
+
+    return disabled_days, min_time, max_time
 
-        try:
-            file_mtime = file_path.stat().st_mtime
-            cache_entry = processed_data_cache.get(file_path.name)
 
-            if cache_entry:
-                file_min_time = pd.Timestamp(cache_entry['min_time'])
-                file_max_time = pd.Timestamp(cache_entry['max_time'])
-                file_available_days = cache_entry['available_days']
-                #print(f"Loaded {file_path.name} from cache", file_min_time, file_max_time,len(file_available_days))
-            else:
-                file_min_time, file_max_time, file_available_days = process_file(str(file_path))
-
-                if file_min_time is not None and file_max_time is not None:
-                    processed_data_cache[file_path.name] = {
-                        'mtime': file_mtime,
-                        'min_time': file_min_time,
-                        'max_time': file_max_time,
-                        'available_days': file_available_days
-                    }
-                    cache_updated = True
-
-            if file_available_days:
-                min_time = min(min_time, file_min_time)
-                max_time = max(max_time, file_max_time)
-                available_days.update(file_available_days)
-                valid_data_found = True
-
-        except Exception as e:
-            print(f"Error processing file {file_path}: {e}")
-            continue
+# Instruments whose index is kept up to date by the background watcher
+watched_instruments = set()
+_index_summaries = {}
 
-    if cache_updated:
-        save_cache(processed_data_cache, id_prefix)
 
-    if not valid_data_found:
-        return [], date.today(), date.today()  # Return today's date instead of None
+def refresh_unwatched(id_prefix):
+    """Refresh the index of an instrument the background watcher does not keep fresh; cheap when nothing changed."""
+    if id_prefix in watched_instruments:
+        return
+    directory = fixed_directories.get(id_prefix)
+    if directory and Path(directory).exists():
+        refresh_index(id_prefix)
 
-    disabled_days = []
-    if min_time != pd.Timestamp.max and max_time != pd.Timestamp.min:
-        all_days = set(pd.date_range(start=min_time, end=max_time).date)
-        disabled_days = sorted(all_days - available_days)
 
-    # Convert to date objects for consistency
-    min_time = min_time.date()
-    max_time = max_time.date()
+@coalesce(lambda id_prefix: id_prefix)
+def get_index_summary(id_prefix):
+    """
+    Return load_all_data's (disabled_days, min_time, max_time) for the date pickers.
+    The summary is recomputed only when the index version changes. Instruments the
+    background watcher keeps fresh are never rescanned here; the others are
+    refreshed lazily, which is cheap when nothing changed. Threads landing on a
+    cold page at the same time share one computation.
+    """
+    refresh_unwatched(id_prefix)
 
-    return disabled_days, min_time, max_time
+    version = get_file_index().version(id_prefix)
+    cached = _index_summaries.get(id_prefix)
+    if cached is not None and cached[0] == version:
+        return cached[1]
+
+    summary = load_all_data(id_prefix, refresh=False)
+    _index_summaries[id_prefix] = (version, summary)
+    return summary
 
 
 def process_file(file_path):
-    """Process an individual .nc file to extract min_time, max_time, and available days."""
+    """
+    Process an individual .nc file to extract min_time, max_time, available days and the
+    channel metadata of thermetry and dilution fridge files (see FileIndex.upsert_many).
+    A file without valid data gives None times; None is returned when the file could
+    not be read, e.g. on an HDF5 error, so that it is not indexed and is tried again.
+    """
     min_time, max_time = None, None
     available_days = set()
+    channels = []
 
     try:
         # Extract the date from filename (assuming format: thermetry_YYYY-MM-DD_...)
         file_date_str = os.path.basename(file_path).split('_')[1]
         file_date = pd.to_datetime(file_date_str)  # Convert to Timestamp instead of date
+    except (IndexError, ValueError) as e:
+        print(f"Invalid File: {file_path} ({e})")
+        return min_time, max_time, available_days, channels
 
-        # Allow data range
-        valid_start = file_date
-        valid_end = file_date + pd.Timedelta(days=365)
+    # Allow data range
+    valid_start = file_date
+    valid_end = file_date + pd.Timedelta(days=365)
 
-        with xr.open_dataset(file_path) as ds:
+    try:
+        with nc_lock, netCDF4.Dataset(file_path) as ds:
             if 'thermetry_' in file_path and os.path.basename(file_path) not in thermetry_invalid_files:
-                min_time, max_time, available_days = _process_data(
+                min_time, max_time, available_days, channels = _process_data(
                     ds, 'Data.ToltecThermetry.Time', 16,
                     valid_start=valid_start,
                     valid_end=valid_end,
-                    file_path=file_path  # Pass file_path for better error messages
+                    file_path=file_path,  # Pass file_path for better error messages
+                    value_var_base='Data.ToltecThermetry.Temperature',
+                    labels=ToltecThermetryFile.channel_labels(ds)
                 )
             elif 'dilutionFridge_' in file_path:
-                min_time, max_time, available_days = _process_data(
+                min_time, max_time, available_days, sample_time = _process_data(
                     ds, 'Data.ToltecDilutionFridge.SampleTime',
                     valid_start=valid_start,
                     valid_end=valid_end,
                     file_path=file_path
                 )
+                # Every variable shares SampleTime, so only their presence is recorded
+                channels = [(label, variable, *sample_time[0][2:])
+                            for label, variable in ToltecDilutionFridgeFile.variables_present(ds)]
             elif 'cryocmp_' in file_path:
-                min_time, max_time, available_days = _process_data(
+                min_time, max_time, available_days, _ = _process_data(
                     ds, 'Data.ToltecCryocmp.Time',
                     valid_start=valid_start,
                     valid_end=valid_end,
                     file_path=file_path
                 )
             elif 'rsfend_' in file_path:
-                min_time, max_time, available_days = _process_data(
+                min_time, max_time, available_days, _ = _process_data(
                     ds, 'Data.Rsfend.Time',
                     valid_start=valid_start,
                     valid_end=valid_end,
@@ -207,85 +356,85 @@ def process_file(file_path):
 
     except Exception as e:
         print(f"Error processing file {file_path}: {e}")
+        return None
 
-    return min_time, max_time, available_days
+    return min_time, max_time, available_days, channels
 
 
-def _process_data(ds, time_var_base, num_channels=1, valid_start=None, valid_end=None, file_path=None):
-    """Generalized function to process data and extract min_time, max_time, and available days."""
-    min_time, max_time = pd.Timestamp.max, pd.Timestamp.min
+def _process_data(ds, time_var_base, num_channels=1, valid_start=None, valid_end=None, file_path=None,
+                  value_var_base=None, labels=None):
+    """
+    Generalized function to process data and extract min_time, max_time, available days and
+    one (channel, time variable, min_time, max_time, count, all_zero) row per channel.
+    Only the endpoints and day boundaries of sorted time variables are read (see nc_utils.scan_time);
+    with value_var_base the values of each channel are sampled to tell whether they are all zero.
+    """
+    valid_start = to_epoch(valid_start) if valid_start is not None else 0
+    valid_end = to_epoch(valid_end) if valid_end is not None else float('inf')
+    min_time, max_time = None, None
     available_days = set()
+    channels = []
 
     for i in range(1, num_channels + 1):
         time_var = f'{time_var_base}{i}' if num_channels > 1 else time_var_base
-        if time_var in ds.variables:
-            time_data = ds[time_var].values
-
-            # Print raw time range for debugging
-            if len(time_data) > 0:
-                print(f"Channel {i} raw time range: {time_data.min()} to {time_data.max()}")
-
-            time_data = time_data[time_data > 0]  # Filter non-positive times
-
-            if len(time_data) == 0:
-                continue
-
-            # Convert to datetime
-            timestamps = pd.to_datetime(time_data, unit='s')
-
-            # Filter timestamps within valid range
-            if valid_start and valid_end:
-                # Convert timestamps to tz-naive if they're tz-aware
-                if timestamps.tz is not None:
-                    timestamps = timestamps.tz_localize(None)
-
-                mask = (timestamps >= valid_start) & (timestamps <= valid_end)
-                valid_timestamps = timestamps[mask]
+        channel = labels[i - 1] if labels else time_var
+        if time_var not in ds.variables or ds.variables[time_var].shape[0] == 0:
+            channels.append((channel, time_var, None, None, 0, False))
+            continue
+        var = ds.variables[time_var]
 
-                if len(valid_timestamps) == 0:
-                    print(f"Warning: All timestamps in {file_path} channel {i} were outside valid range")
-                    print(f"Time range: {timestamps.min()} to {timestamps.max()}")
-                    print(f"Valid range: {valid_start} to {valid_end}")
-                    continue
+        scanned = scan_time(var, valid_start, valid_end)
+        if scanned is None:
+            print(f"Warning: No timestamps in {file_path} channel {i} within the valid range "
+                  f"{from_epoch(valid_start)} to {from_epoch(valid_end)}")
+            channels.append((channel, time_var, None, None, 0, False))
+            continue
 
-                timestamps = valid_timestamps
+        channel_min, channel_max, days, records = scanned
+        all_zero = False
+        if value_var_base is not None:
+            value_var = f'{value_var_base}{i}' if num_channels > 1 else value_var_base
+            all_zero = value_var in ds.variables and not any_nonzero(ds.variables[value_var], records)
+        channels.append((channel, time_var, channel_min, channel_max, record_count(records), bool(all_zero)))
 
-            min_time = min(min_time, timestamps.min())
-            max_time = max(max_time, timestamps.max())
-            available_days.update(timestamps.normalize().date)
+        min_time = channel_min if min_time is None else min(min_time, channel_min)
+        max_time = channel_max if max_time is None else max(max_time, channel_max)
+        available_days.update(EPOCH_DATE + timedelta(days=day) for day in days)
 
-    if min_time == pd.Timestamp.max or max_time == pd.Timestamp.min:
-        return None, None, set()
+    if min_time is None:
+        return None, None, set(), channels
 
-    return min_time, max_time, available_days
+    return from_epoch(min_time), from_epoch(max_time), available_days, channels
 
 
-# if start_date == end_date get all the files that contain the start_date
-# if start_date != end_date get all the files that has available date between the start_date and end_date
-# return a list containing the file names
+def get_time_window(id_prefix, hours, start_date, end_date):
+    """
+    Return the requested (start_time, end_time) window in epoch seconds, or None if nothing is indexed.
+    With hours > 0 the window ends at the newest sample, including the live file when
+    the live tail is enabled; otherwise it covers the whole days from start_date through end_date.
+    The index of an instrument without the background watcher is refreshed first.
+    """
+    refresh_unwatched(id_prefix)
+    if hours > 0:
+        max_time = get_file_index().time_range(id_prefix)[1]
+        # Imported here because utils.live_tail imports the data_files readers, which import this module
+        from utils.live_tail import live_tail_enabled, get_live_tail
+        if live_tail_enabled():
+            live_max_time = get_live_tail(id_prefix).max_time()
+            if live_max_time is not None:
+                max_time = live_max_time if max_time is None else max(max_time, live_max_time)
+        if max_time is None:
+            return None
+        return max_time - hours * 3600, max_time
+
+    start_time = to_epoch(pd.Timestamp(start_date).normalize())
+    end_time = to_epoch(pd.Timestamp(end_date).normalize() + pd.Timedelta(days=1))
+    return start_time, end_time
+
+
+# return a list containing the names of the files overlapping the requested window, oldest first
 def get_files(id_prefix, hours, start_date, end_date):
-    # Load existing cache (if any)
-    processed_data_cache = load_cache(id_prefix) or {}
-    # if hours is 0 then the start_date and end_date are dates from the date picker, else date is more max_time
-    if hours == 0:
-        start_date = pd.Timestamp(start_date).date()
-        end_date = pd.Timestamp(end_date).date()
-    else:
-        # get the data in the last file that was processed
-        print("Getting last file", id_prefix,load_all_data(id_prefix)[2])
-        end_date = load_all_data(id_prefix)[2]
-        start_date = end_date
-    # Initialize data dictionary
-    files = []
-    for file, metadata in processed_data_cache.items():
-        min_time = metadata['min_time'].date()
-        max_time = metadata['max_time'].date()
-        if start_date == end_date:
-            if min_time <= start_date <= max_time:
-                files.append(file)
-            else:
-                continue
-        else:
-            if metadata['available_days'] & set(pd.date_range(start=start_date, end=end_date).date):
-                files.append(file)
-    return files
\ No newline at end of file
+    window = get_time_window(id_prefix, hours, start_date, end_date)
+    if window is None:
+        return []
+    return get_file_index().files_overlapping(id_prefix, *window)
@@ -0,0 +1,55 @@
+import numpy as np
+
+
+def pack_days(days):
+    """
+    Bitmap of a collection of day ordinals: (first_day, bytes) where bit i of the
+    np.packbits bytes is set if day first_day + i is covered; (None, None) if empty.
+    """
+    days = np.unique(np.fromiter(days, dtype=np.int64))
+    if len(days) == 0:
+        return None, None
+    bits = np.zeros(days[-1] - days[0] + 1, dtype=bool)
+    bits[days - days[0]] = True
+    return int(days[0]), np.packbits(bits).tobytes()
+
+
+def unpack_days(blob):
+    """Boolean coverage array of a packed bitmap (padded with False to a multiple of 8)."""
+    return np.unpackbits(np.frombuffer(blob, dtype=np.uint8)).astype(bool)
+
+
+class DayCoverage:
+    """
+    Union of per-file day bitmaps as one boolean array indexed by day ordinal - first_day,
+    so coverage queries are vectorized operations instead of set arithmetic on dates.
+    """
+
+    def __init__(self, bitmaps):
+        bitmaps = [(first_day, unpack_days(blob)) for first_day, blob in bitmaps if first_day is not None]
+        if not bitmaps:
+            self.first_day = 0
+            self.bits = np.zeros(0, dtype=bool)
+            return
+        self.first_day = min(first_day for first_day, _ in bitmaps)
+        end = max(first_day + len(bits) for first_day, bits in bitmaps)
+        self.bits = np.zeros(end - self.first_day, dtype=bool)
+        for first_day, bits in bitmaps:
+            offset = first_day - self.first_day
+            self.bits[offset:offset + len(bits)] |= bits
+
+    def covered(self, start_day, end_day):
+        """Boolean array telling which days of [start_day, end_day] have data."""
+        days = np.zeros(end_day - start_day + 1, dtype=bool)
+        lo, hi = max(start_day, self.first_day), min(end_day + 1, self.first_day + len(self.bits))
+        if lo < hi:
+            days[lo - start_day:hi - start_day] = self.bits[lo - self.first_day:hi - self.first_day]
+        return days
+
+    def days(self):
+        """Sorted day ordinals that have data."""
+        return np.flatnonzero(self.bits) + self.first_day
+
+    def missing(self, start_day, end_day):
+        """Sorted day ordinals of [start_day, end_day] without data."""
+        return np.flatnonzero(~self.covered(start_day, end_day)) + start_day
@@ -0,0 +1,179 @@
+import json
+import os
+import shutil
+import tempfile
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+from utils.data_utils import load_config, fixed_directories, get_file_index, to_epoch, from_epoch
+from utils.merge_utils import merge_channel
+from utils.rollup_store import reader_class
+
+config_path = "./config.yaml"
+config = load_config(config_path)
+day_cache_config = config.get('day_cache', {})
+
+DAY_CACHE_DIR = Path(day_cache_config.get('path', './cache/columns'))
+DAY_SECONDS = 86400
+# Stored in every manifest; days written by older readers are built again
+# 1: thermetry channel labels without their null padding
+# 2: samples repeated by overlapping files kept once
+DAY_CACHE_FORMAT = 2
+
+
+def day_cache_enabled():
+    return bool(day_cache_config.get('enabled'))
+
+
+def _day_dir(id_prefix, day):
+    return DAY_CACHE_DIR / id_prefix / day.isoformat()
+
+
+def _day_sources(id_prefix, day, file_stats):
+    """{name: [size, mtime]} of the indexed files holding data for the UTC day."""
+    day_start = to_epoch(pd.Timestamp(day))
+    names = get_file_index().files_overlapping(id_prefix, day_start, day_start + DAY_SECONDS)
+    return {name: list(file_stats[name]) for name in names}
+
+
+def _load_day(id_prefix, day, sources):
+    """
+    Load a cached day as {channel: (times, values)}, memory-mapped, or None when the
+    day is not cached, was built by older readers or from files that have changed since.
+    """
+    day_dir = _day_dir(id_prefix, day)
+    try:
+        with open(day_dir / 'manifest.json') as f:
+            manifest = json.load(f)
+    except (FileNotFoundError, json.JSONDecodeError):
+        return None
+    if manifest.get('format') != DAY_CACHE_FORMAT or manifest['sources'] != sources:
+        return None
+
+    columns = {}
+    for i, channel in enumerate(manifest['channels']):
+        columns[channel] = (np.load(day_dir / f'{i}.time.npy', mmap_mode='r'),
+                            np.load(day_dir / f'{i}.value.npy', mmap_mode='r'))
+    return columns
+
+
+def _save_day(id_prefix, day, sources, columns):
+    """Write one day atomically: build it in a temporary directory, then rename it into place."""
+    day_dir = _day_dir(id_prefix, day)
+    day_dir.parent.mkdir(parents=True, exist_ok=True)
+    tmp_dir = Path(tempfile.mkdtemp(dir=day_dir.parent, prefix=f'.{day.isoformat()}-'))
+    try:
+        channels = list(columns)
+        for i, channel in enumerate(channels):
+            times, values = columns[channel]
+            np.save(tmp_dir / f'{i}.time.npy', times.astype(np.int64))
+            np.save(tmp_dir / f'{i}.value.npy', values.astype(np.float32))
+        with open(tmp_dir / 'manifest.json', 'w') as f:
+            json.dump({'format': DAY_CACHE_FORMAT, 'channels': channels, 'sources': sources}, f)
+        shutil.rmtree(day_dir, ignore_errors=True)
+        os.replace(tmp_dir, day_dir)
+    except OSError as e:
+        print(f"Error writing day cache {day_dir}: {e}")
+        shutil.rmtree(tmp_dir, ignore_errors=True)
+
+
+def _read_files(id_prefix, names):
+    """
+    Read files with the instrument's netCDF reader into {channel: [(times, values), ...]},
+    skipping the variables the index knows are empty or all zero.
+    """
+    reader = reader_class(id_prefix)
+    directory = Path(fixed_directories[id_prefix])
+    index = get_file_index()
+    traces = {}
+    for name in names:
+        try:
+            data_file = reader(str(directory / name), skip_variables=index.empty_variables(id_prefix, name))
+        except Exception as e:
+            print(f"Error reading file {name}: {e}")
+            continue
+        for channel in getattr(data_file, 'chanLabels', []):
+            traces.setdefault(channel, [])
+        for trace in data_file.get_all_plot_data():
+            times = pd.DatetimeIndex(trace['x']).as_unit('ns').asi8
+            traces.setdefault(str(trace['name']), []).append((times, np.asarray(trace['y'], dtype=np.float32)))
+    return traces
+
+
+def _slice_day(traces, day_start_ns):
+    """
+    Cut the samples of one UTC day out of every channel and merge the files' parts
+    as merge_plot_data does: in time order, with samples repeated by overlapping files kept once.
+    """
+    day_end_ns = day_start_ns + DAY_SECONDS * 10**9
+    columns = {}
+    for channel, parts in traces.items():
+        day_parts = []
+        for times, values in parts:
+            in_day = (times >= day_start_ns) & (times < day_end_ns)
+            times, values = times[in_day], values[in_day]
+            if len(times) > 1 and (np.diff(times) < 0).any():
+                order = np.argsort(times, kind='stable')
+                times, values = times[order], values[order]
+            day_parts.append((times, values))
+        if day_parts:
+            columns[channel] = merge_channel(day_parts)
+        else:
+            columns[channel] = (np.empty(0, dtype=np.int64), np.empty(0, dtype=np.float32))
+    return columns
+
+
+def load_plot_data(id_prefix, start_time, end_time, channels=None):
+    """
+    Plot data for [start_time, end_time] (epoch seconds), assembled day by day from
+    the columnar cache. Days that are not cached yet are read from netCDF once and,
+    if the day is complete, written to the cache for the next request.
+    Returns (plot_data, all_channels), where all_channels includes channels without data.
+    """
+    index = get_file_index()
+    max_time = index.time_range(id_prefix)[1]
+    if max_time is None:
+        return [], []
+    last_complete_day = from_epoch(max_time).date() - pd.Timedelta(days=1)
+
+    days = pd.date_range(from_epoch(start_time).normalize(), from_epoch(end_time).normalize()).date
+    file_stats = index.file_stats(id_prefix)
+    day_columns, missing = {}, {}
+    for day in days:
+        sources = _day_sources(id_prefix, day, file_stats)
+        if not sources:
+            continue
+        columns = _load_day(id_prefix, day, sources)
+        if columns is None:
+            missing[day] = sources
+        else:
+            day_columns[day] = columns
+
+    if missing:
+        traces = _read_files(id_prefix, sorted({name for sources in missing.values() for name in sources}))
+        for day, sources in missing.items():
+            columns = _slice_day(traces, int(to_epoch(pd.Timestamp(day)) * 10**9))
+            day_columns[day] = columns
+            if day <= last_complete_day:
+                _save_day(id_prefix, day, sources, columns)
+
+    start_ns, end_ns = int(start_time * 10**9), int(end_time * 10**9)
+    all_channels = list(dict.fromkeys(channel for columns in day_columns.values() for channel in columns))
+    plot_data = []
+    for channel in all_channels:
+        if channels is not None and channel not in channels:
+            continue
+        parts = [day_columns[day][channel] for day in sorted(day_columns) if channel in day_columns[day]]
+        times = np.concatenate([t for t, _ in parts]) if len(parts) > 1 else parts[0][0]
+        values = np.concatenate([v for _, v in parts]) if len(parts) > 1 else parts[0][1]
+        lo, hi = np.searchsorted(times, start_ns, side='left'), np.searchsorted(times, end_ns, side='right')
+        if hi <= lo:
+            continue
+        plot_data.append({
+            'x': pd.DatetimeIndex(np.asarray(times[lo:hi]).view('datetime64[ns]'), tz='UTC'),
+            'y': values[lo:hi],
+            'name': channel,
+        })
+    return plot_data, all_channels
@@ -0,0 +1,150 @@
+import os
+import threading
+from collections import OrderedDict
+
+from utils.config_utils import load_config
+from utils.single_flight import single_flight
+
+config_path = "./config.yaml"
+config = load_config(config_path)
+file_cache_config = config.get('file_cache', {})
+column_cache_config = config.get('column_cache', {})
+
+
+class LRUCache:
+    """
+    Thread-safe least-recently-used cache bounded by the total size in bytes of its values.
+
+    The size of each value is given by the caller when it is stored; values larger
+    than the whole budget are not cached at all.
+    """
+
+    def __init__(self, max_bytes):
+        self.max_bytes = max_bytes
+        self.nbytes = 0
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._entries)
+
+    def get(self, key):
+        """Return the cached value for key, or None, marking it as most recently used."""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry[0]
+
+    def put(self, key, value, nbytes):
+        """Store value under key, evicting the least recently used entries to stay within max_bytes."""
+        with self._lock:
+            self._discard(key)
+            if nbytes > self.max_bytes:
+                return
+            self._entries[key] = (value, nbytes)
+            self.nbytes += nbytes
+            while self.nbytes > self.max_bytes:
+                self._discard(next(iter(self._entries)))
+
+    def resize(self, key, nbytes):
+        """Update the recorded size of an entry whose value has grown or shrunk."""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return
+            self.nbytes += nbytes - entry[1]
+            self._entries[key] = (entry[0], nbytes)
+            while self.nbytes > self.max_bytes and self._entries:
+                self._discard(next(iter(self._entries)))
+
+    def discard(self, key):
+        with self._lock:
+            self._discard(key)
+
+    def _discard(self, key):
+        entry = self._entries.pop(key, None)
+        if entry is not None:
+            self.nbytes -= entry[1]
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self.nbytes = 0
+
+    def stats(self):
+        return {'entries': len(self._entries), 'nbytes': self.nbytes, 'max_bytes': self.max_bytes,
+                'hits': self.hits, 'misses': self.misses}
+
+
+def file_cache_enabled():
+    return bool(file_cache_config.get('enabled'))
+
+
+_file_cache = None
+_file_cache_lock = threading.Lock()
+
+
+def get_file_cache():
+    """Return the process-wide cache of decoded data files, sized from config.yaml."""
+    global _file_cache
+    with _file_cache_lock:
+        if _file_cache is None:
+            _file_cache = LRUCache(int(file_cache_config.get('max_mb', 512) * 2**20))
+        return _file_cache
+
+
+def column_cache_enabled():
+    return bool(column_cache_config.get('enabled'))
+
+
+_column_cache = None
+_column_cache_lock = threading.Lock()
+
+
+def get_column_cache():
+    """Return the process-wide cache of variables read from data files, sized from config.yaml."""
+    global _column_cache
+    with _column_cache_lock:
+        if _column_cache is None:
+            _column_cache = LRUCache(int(column_cache_config.get('max_mb', 128) * 2**20))
+        return _column_cache
+
+
+def open_data_file(file_class, file_path, time_window=None, skip_variables=()):
+    """
+    Return a decoded file_class reader for file_path, without reading skip_variables.
+
+    With the file cache enabled the whole file is decoded once and kept, keyed by
+    (reader, path, size, mtime, skip_variables), so a rewritten file is decoded again;
+    callers filter the cached reader to their window. Without it only time_window is read.
+    """
+    if not file_cache_enabled():
+        return file_class(file_path, time_window=time_window, skip_variables=skip_variables)
+
+    stat = os.stat(file_path)
+    skip_variables = frozenset(skip_variables)
+    key = (file_class.__name__, os.path.abspath(file_path), stat.st_size, stat.st_mtime_ns, skip_variables)
+    cache = get_file_cache()
+    data_file = cache.get(key)
+    if data_file is not None:
+        # Readers that load variables on demand may have grown since they were stored
+        if data_file.LAZY_VARIABLES:
+            cache.resize(key, data_file.memory_usage())
+        return data_file
+
+    # Threads asking for the same file at once decode it once
+    return single_flight.do(('open_data_file', key), _decode, cache, key, file_class, file_path, skip_variables)
+
+
+def _decode(cache, key, file_class, file_path, skip_variables):
+    data_file = file_class(file_path, skip_variables=skip_variables)
+    # Cached readers do not hold the file open; lazy ones reopen it for variables they have not read
+    data_file.close()
+    cache.put(key, data_file, data_file.memory_usage())
+    return data_file
@@ -0,0 +1,326 @@
+import sqlite3
+import threading
+from bisect import bisect_left, bisect_right
+from contextlib import contextmanager
+from pathlib import Path
+
+INDEX_PATH = './cache/file_index.sqlite'
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS files (
+    instrument TEXT NOT NULL,
+    name TEXT NOT NULL,
+    size INTEGER NOT NULL,
+    mtime REAL NOT NULL,
+    min_time REAL,
+    max_time REAL,
+    first_day INTEGER,
+    day_bits BLOB,
+    PRIMARY KEY (instrument, name)
+);
+CREATE INDEX IF NOT EXISTS files_time ON files (instrument, min_time, max_time);
+CREATE TABLE IF NOT EXISTS channels (
+    instrument TEXT NOT NULL,
+    name TEXT NOT NULL,
+    channel TEXT NOT NULL,
+    variable TEXT NOT NULL,
+    min_time REAL,
+    max_time REAL,
+    count INTEGER NOT NULL,
+    all_zero INTEGER NOT NULL,
+    PRIMARY KEY (instrument, name, channel)
+);
+CREATE TABLE IF NOT EXISTS directories (
+    instrument TEXT PRIMARY KEY,
+    mtime_ns INTEGER NOT NULL
+);
+CREATE TABLE IF NOT EXISTS versions (
+    instrument TEXT PRIMARY KEY,
+    version INTEGER NOT NULL
+);
+"""
+# PRAGMA user_version of an index holding everything the current scan records;
+# 2: channel labels are stored without their null padding
+INDEX_FORMAT = 2
+
+
+class IntervalIndex:
+    """
+    Sorted-boundary index over file [min_time, max_time] spans.
+
+    Spans are sorted by start time together with the running maximum of their
+    end times, which is non-decreasing. A window query binary-searches both
+    arrays to find the candidate run and only checks the spans inside it, so
+    for an archive of consecutive files it costs O(log n + k).
+    """
+
+    def __init__(self, spans):
+        spans = sorted(spans, key=lambda span: span[1])
+        self.names = [name for name, _, _ in spans]
+        self.starts = [start for _, start, _ in spans]
+        self.ends = [end for _, _, end in spans]
+        self.running_max_ends = []
+        running_max = float('-inf')
+        for end in self.ends:
+            running_max = max(running_max, end)
+            self.running_max_ends.append(running_max)
+
+    def __len__(self):
+        return len(self.names)
+
+    def overlapping(self, start_time, end_time):
+        """Return names of spans that overlap [start_time, end_time], oldest first."""
+        lo = bisect_left(self.running_max_ends, start_time)
+        hi = bisect_right(self.starts, end_time)
+        return [self.names[i] for i in range(lo, hi) if self.ends[i] >= start_time]
+
+
+class SqliteStore:
+    """
+    Base class for the SQLite stores under ./cache.
+
+    Every thread gets its own connection and writes go through BEGIN IMMEDIATE
+    transactions, so concurrent mod_wsgi threads and processes never interleave
+    partial updates.
+    """
+    schema = ''
+
+    def __init__(self, db_path):
+        self.db_path = Path(db_path)
+        self.db_path.parent.mkdir(parents=True, exist_ok=True)
+        self._local = threading.local()
+        self._connect().executescript(self.schema)
+
+    def _connect(self):
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = sqlite3.connect(self.db_path, timeout=30, isolation_level=None, check_same_thread=False)
+            conn.execute('PRAGMA journal_mode=WAL')
+            conn.execute('PRAGMA synchronous=NORMAL')
+            self._local.conn = conn
+        return conn
+
+    @contextmanager
+    def transaction(self):
+        """Run the enclosed statements in a single write transaction."""
+        conn = self._connect()
+        conn.execute('BEGIN IMMEDIATE')
+        try:
+            yield conn
+        except Exception:
+            conn.execute('ROLLBACK')
+            raise
+        conn.execute('COMMIT')
+
+
+class FileIndex(SqliteStore):
+    """
+    SQLite-backed metadata index with one row per data file.
+
+    Times are stored as UTC epoch seconds and covered days as a bitmap over date
+    ordinals starting at first_day (see utils/day_bitmap.py). Files that were
+    scanned but hold no valid data keep a row with NULL times, so they are not
+    scanned again.
+
+    The channels table describes the channels of each file: the thermetry
+    channels with their time range, sample count and whether all their values
+    are zero, and the dilution fridge variables present in the file.
+    """
+    schema = SCHEMA
+
+    def __init__(self, db_path=INDEX_PATH):
+        super().__init__(db_path)
+        self._migrate_file_days()
+        self._rescan_older_format()
+        self._interval_indexes = {}
+        self._day_coverages = {}
+        self._interval_lock = threading.Lock()
+
+    def _migrate_file_days(self):
+        """Move the per-day rows of indexes written before day bitmaps into the files table."""
+        # numpy is imported on first use, this module is loaded at startup
+        from utils.day_bitmap import pack_days
+
+        conn = self._connect()
+        if not conn.execute("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'file_days'").fetchone():
+            return
+        with self.transaction() as conn:
+            columns = {row[1] for row in conn.execute('PRAGMA table_info(files)')}
+            if 'day_bits' not in columns:
+                conn.execute('ALTER TABLE files ADD COLUMN first_day INTEGER')
+                conn.execute('ALTER TABLE files ADD COLUMN day_bits BLOB')
+            if conn.execute("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'file_days'").fetchone():
+                file_days = {}
+                for instrument, name, day in conn.execute('SELECT instrument, name, day FROM file_days'):
+                    file_days.setdefault((instrument, name), []).append(day)
+                conn.executemany(
+                    'UPDATE files SET first_day = ?, day_bits = ? WHERE instrument = ? AND name = ?',
+                    [(*pack_days(days), instrument, name) for (instrument, name), days in file_days.items()])
+                conn.execute('DROP TABLE file_days')
+
+    def _rescan_older_format(self):
+        """Have every file rescanned once when the index was written by an older scan."""
+        with self.transaction() as conn:
+            if conn.execute('PRAGMA user_version').fetchone()[0] >= INDEX_FORMAT:
+                return
+            # A changed mtime makes refresh_index scan the file again; its current row stays usable meanwhile
+            conn.execute('UPDATE files SET mtime = -1')
+            conn.execute('DELETE FROM directories')
+            conn.execute(f'PRAGMA user_version = {INDEX_FORMAT}')
+
+    @staticmethod
+    def _bump_version(conn, instrument):
+        conn.execute(
+            'INSERT INTO versions (instrument, version) VALUES (?, 1) '
+            'ON CONFLICT (instrument) DO UPDATE SET version = version + 1',
+            (instrument,))
+
+    def version(self, instrument):
+        """Return the instrument's index version, which changes on every write."""
+        row = self._connect().execute(
+            'SELECT version FROM versions WHERE instrument = ?', (instrument,)).fetchone()
+        return row[0] if row else 0
+
+    def upsert_many(self, instrument, rows):
+        """
+        Insert or replace file rows in one transaction.
+        rows: iterable of (name, size, mtime, min_time, max_time, days, channels), days being
+        date ordinals and channels (channel, variable, min_time, max_time, count, all_zero) tuples
+        """
+        from utils.day_bitmap import pack_days
+
+        rows = list(rows)
+        if not rows:
+            return
+        with self.transaction() as conn:
+            self._bump_version(conn, instrument)
+            conn.executemany(
+                'INSERT OR REPLACE INTO files (instrument, name, size, mtime, min_time, max_time, first_day, day_bits) '
+                'VALUES (?, ?, ?, ?, ?, ?, ?, ?)',
+                [(instrument, name, size, mtime, min_time, max_time, *pack_days(days))
+                 for name, size, mtime, min_time, max_time, days, _ in rows])
+            conn.executemany('DELETE FROM channels WHERE instrument = ? AND name = ?',
+                             [(instrument, row[0]) for row in rows])
+            conn.executemany(
+                'INSERT INTO channels (instrument, name, channel, variable, min_time, max_time, count, all_zero) '
+                'VALUES (?, ?, ?, ?, ?, ?, ?, ?)',
+                [(instrument, row[0], *channel) for row in rows for channel in row[6]])
+
+    def remove(self, instrument, names):
+        """Drop the rows of files that no longer exist."""
+        names = list(names)
+        if not names:
+            return
+        with self.transaction() as conn:
+            self._bump_version(conn, instrument)
+            for name in names:
+                conn.execute('DELETE FROM files WHERE instrument = ? AND name = ?', (instrument, name))
+                conn.execute('DELETE FROM channels WHERE instrument = ? AND name = ?', (instrument, name))
+
+    def file_stats(self, instrument):
+        """Return {name: (size, mtime)} for every indexed file of the instrument."""
+        rows = self._connect().execute(
+            'SELECT name, size, mtime FROM files WHERE instrument = ?', (instrument,))
+        return {name: (size, mtime) for name, size, mtime in rows}
+
+    def recently_modified(self, instrument, limit):
+        """Return {name: (size, mtime)} for the most recently modified files."""
+        rows = self._connect().execute(
+            'SELECT name, size, mtime FROM files WHERE instrument = ? ORDER BY mtime DESC LIMIT ?',
+            (instrument, limit))
+        return {name: (size, mtime) for name, size, mtime in rows}
+
+    def directory_mtime(self, instrument):
+        """Return the directory mtime (ns) recorded by the last full listing, or None."""
+        row = self._connect().execute(
+            'SELECT mtime_ns FROM directories WHERE instrument = ?', (instrument,)).fetchone()
+        return row[0] if row else None
+
+    def set_directory_mtime(self, instrument, mtime_ns):
+        with self.transaction() as conn:
+            conn.execute('INSERT OR REPLACE INTO directories (instrument, mtime_ns) VALUES (?, ?)',
+                         (instrument, mtime_ns))
+
+    def is_empty(self, instrument):
+        row = self._connect().execute(
+            'SELECT 1 FROM files WHERE instrument = ? LIMIT 1', (instrument,)).fetchone()
+        return row is None
+
+    def time_range(self, instrument):
+        """Return (min_time, max_time) over all files, or (None, None) if there is no valid data."""
+        return self._connect().execute(
+            'SELECT MIN(min_time), MAX(max_time) FROM files WHERE instrument = ? AND min_time IS NOT NULL',
+            (instrument,)).fetchone()
+
+    def day_coverage(self, instrument):
+        """
+        Return the DayCoverage of the instrument, the union of its files' day bitmaps.
+        It is built once and only rebuilt after the index version changes.
+        """
+        from utils.day_bitmap import DayCoverage
+
+        version = self.version(instrument)
+        with self._interval_lock:
+            cached = self._day_coverages.get(instrument)
+            if cached is not None and cached[0] == version:
+                return cached[1]
+            rows = self._connect().execute(
+                'SELECT first_day, day_bits FROM files WHERE instrument = ? AND day_bits IS NOT NULL',
+                (instrument,)).fetchall()
+            day_coverage = DayCoverage(rows)
+            self._day_coverages[instrument] = (version, day_coverage)
+            return day_coverage
+
+    def interval_index(self, instrument):
+        """
+        Return the IntervalIndex of the instrument's files.
+        It is built once and only rebuilt after the index version changes.
+        """
+        version = self.version(instrument)
+        with self._interval_lock:
+            cached = self._interval_indexes.get(instrument)
+            if cached is not None and cached[0] == version:
+                return cached[1]
+            rows = self._connect().execute(
+                'SELECT name, min_time, max_time FROM files WHERE instrument = ? AND min_time IS NOT NULL',
+                (instrument,)).fetchall()
+            interval_index = IntervalIndex(rows)
+            self._interval_indexes[instrument] = (version, interval_index)
+            return interval_index
+
+    def channel_coverage(self, instrument, start_time, end_time):
+        """
+        Return {channel: has_data} for the channels of the files overlapping [start_time, end_time].
+        A channel has data when at least one file holds samples of it inside the window that
+        are not all zero. Empty when the files have no channel metadata.
+        """
+        rows = self._connect().execute(
+            'SELECT c.channel, MAX(c.count > 0 AND NOT c.all_zero AND c.min_time <= ? AND c.max_time >= ?) '
+            'FROM channels c JOIN files f ON f.instrument = c.instrument AND f.name = c.name '
+            'WHERE c.instrument = ? AND f.min_time <= ? AND f.max_time >= ? GROUP BY c.channel',
+            (end_time, start_time, instrument, end_time, start_time))
+        return {channel: bool(has_data) for channel, has_data in rows}
+
+    def empty_variables(self, instrument, name):
+        """Return the variables of a file's channels that hold no samples or only zeros."""
+        rows = self._connect().execute(
+            'SELECT variable FROM channels WHERE instrument = ? AND name = ? AND (count = 0 OR all_zero)',
+            (instrument, name))
+        return {variable for variable, in rows}
+
+    def files_overlapping(self, instrument, start_time, end_time):
+        """Return names of files whose [min_time, max_time] overlaps [start_time, end_time], oldest first."""
+        return self.interval_index(instrument).overlapping(start_time, end_time)
+
+
+_file_index = None
+_file_index_lock = threading.Lock()
+
+
+def get_file_index():
+    """Return the process-wide FileIndex, opening it on first use."""
+    global _file_index
+    with _file_index_lock:
+        if _file_index is None:
+            _file_index = FileIndex()
+        return _file_index
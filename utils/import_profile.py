@@ -0,0 +1,74 @@
+"""
+Import-time profile of the WSGI entry point, enabled with LMT_IMPORT_PROFILE=1.
+
+enable() wraps builtins.__import__ so every module imported for the first time
+records how long its import took, in total and excluding the imports nested in
+it; report() prints the slowest ones. Only for diagnosing startup time.
+"""
+import builtins
+import importlib.util
+import os
+import sys
+import threading
+import time
+
+ENV_VAR = 'LMT_IMPORT_PROFILE'
+
+_original_import = builtins.__import__
+_timings = {}
+_local = threading.local()
+_started = None
+
+
+def profiling_requested():
+    return os.environ.get(ENV_VAR, '') not in ('', '0')
+
+
+def _resolve(name, globals, level):
+    if level == 0:
+        return name
+    package = (globals or {}).get('__package__') or ''
+    try:
+        return importlib.util.resolve_name('.' * level + name, package)
+    except (ImportError, ValueError):
+        return name
+
+
+def _timed_import(name, globals=None, locals=None, fromlist=(), level=0):
+    module_name = _resolve(name, globals, level)
+    if module_name in sys.modules:
+        return _original_import(name, globals, locals, fromlist, level)
+
+    stack = _local.__dict__.setdefault('stack', [])
+    stack.append(0.0)
+    start = time.perf_counter()
+    try:
+        return _original_import(name, globals, locals, fromlist, level)
+    finally:
+        elapsed = time.perf_counter() - start
+        nested = stack.pop()
+        if stack:
+            stack[-1] += elapsed
+        if module_name not in _timings:
+            _timings[module_name] = (elapsed, elapsed - nested)
+
+
+def enable():
+    global _started
+    if builtins.__import__ is not _timed_import:
+        _started = time.perf_counter()
+        builtins.__import__ = _timed_import
+
+
+def disable():
+    builtins.__import__ = _original_import
+
+
+def report(top=30):
+    """Stop profiling and print the slowest imports in milliseconds, cumulative and self."""
+    disable()
+    total = (time.perf_counter() - _started) * 1000 if _started else 0
+    print(f"Import profile: {len(_timings)} modules, {total:.0f} ms")
+    print(f"{'cumulative ms':>14} {'self ms':>9}  module")
+    for module_name, (cumulative, own) in sorted(_timings.items(), key=lambda item: -item[1][0])[:top]:
+        print(f"{cumulative * 1000:14.1f} {own * 1000:9.1f}  {module_name}")
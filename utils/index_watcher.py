@@ -0,0 +1,103 @@
+import threading
+import time
+import traceback
+from pathlib import Path
+
+try:
+    from inotify_simple import INotify, flags
+except ImportError:
+    INotify = None
+
+# Collect further events for this long after the first one before refreshing
+DEBOUNCE_SECONDS = 2
+
+
+class IndexWatcher(threading.Thread):
+    """
+    Background thread that keeps the file index of each instrument directory up to date.
+
+    With inotify_simple installed, file events wake the thread and only the
+    touched files are re-checked; a full refresh still runs every poll_interval
+    seconds to catch anything inotify missed. Without it the thread polls.
+    Every index write bumps the instrument's version, which the date pickers read.
+    """
+
+    def __init__(self, instruments, poll_interval=60):
+        super().__init__(name='index-watcher', daemon=True)
+        self.instruments = instruments
+        self.poll_interval = poll_interval
+        self._stop_event = threading.Event()
+
+    def stop(self):
+        self._stop_event.set()
+
+    def refresh(self, id_prefix, names=()):
+        from utils.data_utils import refresh_index
+        try:
+            changed = refresh_index(id_prefix, names)
+            if changed:
+                print(f"Index watcher updated {changed} files for {id_prefix}")
+        except Exception as e:
+            print(f"Index watcher failed to refresh {id_prefix}: {e}")
+            print(traceback.format_exc())
+
+    def run(self):
+        # The data stack is imported by this thread rather than at startup
+        from utils.data_utils import fixed_directories, watched_instruments
+
+        self.instruments = [i for i in self.instruments if Path(fixed_directories.get(i, '')).is_dir()]
+        for id_prefix in self.instruments:
+            self.refresh(id_prefix)
+            watched_instruments.add(id_prefix)
+
+        if INotify is not None:
+            try:
+                self._watch()
+                return
+            except OSError as e:
+                print(f"inotify unavailable ({e}), falling back to polling")
+        self._poll()
+
+    def _poll(self):
+        while not self._stop_event.wait(self.poll_interval):
+            for id_prefix in self.instruments:
+                self.refresh(id_prefix)
+
+    def _watch(self):
+        from utils.data_utils import fixed_directories
+        inotify = INotify()
+        mask = flags.CREATE | flags.CLOSE_WRITE | flags.MODIFY | flags.DELETE | flags.MOVED_TO | flags.MOVED_FROM
+        watches = {inotify.add_watch(fixed_directories[i], mask): i for i in self.instruments}
+        last_full_refresh = time.monotonic()
+
+        with inotify:
+            while not self._stop_event.is_set():
+                events = inotify.read(timeout=self.poll_interval * 1000, read_delay=DEBOUNCE_SECONDS * 1000)
+
+                touched = {}
+                for event in events:
+                    id_prefix = watches.get(event.wd)
+                    # The live {id_prefix}.nc file is written continuously and is not indexed
+                    if id_prefix is None or not event.name.endswith('.nc') or event.name == f'{id_prefix}.nc':
+                        continue
+                    touched.setdefault(id_prefix, set()).add(event.name)
+
+                for id_prefix, names in touched.items():
+                    self.refresh(id_prefix, names)
+
+                if time.monotonic() - last_full_refresh >= self.poll_interval:
+                    for id_prefix in self.instruments:
+                        self.refresh(id_prefix)
+                    last_full_refresh = time.monotonic()
+
+
+_index_watcher = None
+
+
+def start_index_watcher(instruments, poll_interval=60):
+    """Start the process-wide index watcher once and return it."""
+    global _index_watcher
+    if _index_watcher is None:
+        _index_watcher = IndexWatcher(instruments, poll_interval)
+        _index_watcher.start()
+    return _index_watcher
@@ -0,0 +1,149 @@
+import os
+import threading
+import time
+
+import netCDF4
+import numpy as np
+import pandas as pd
+
+from utils.data_utils import load_config, fixed_directories
+from utils.merge_utils import to_ns
+from utils.nc_utils import nc_lock, valid_length
+from utils.rollup_store import reader_class
+
+config_path = "./config.yaml"
+config = load_config(config_path)
+live_tail_config = config.get('live_tail', {})
+
+# Samples older than this, relative to the newest live sample, are dropped from memory
+RETENTION_SECONDS = live_tail_config.get('retention_hours', 24) * 3600
+# The live file is not checked again within this many seconds of the last check
+POLL_SECONDS = live_tail_config.get('poll_seconds', 5)
+
+
+def live_tail_enabled():
+    return bool(live_tail_config.get('enabled'))
+
+
+class LiveTail:
+    """
+    Incremental reader of the live {id_prefix}.nc file that is still being written.
+
+    It remembers how many records of each time variable it has consumed and on each
+    poll reads only the records appended since, keeping the last RETENTION_SECONDS
+    of every channel in memory. A new file (rotation) or a shrinking record count
+    starts the tail over from the first record.
+    """
+
+    def __init__(self, id_prefix):
+        self.id_prefix = id_prefix
+        self.file_path = os.path.join(fixed_directories[id_prefix], f'{id_prefix}.nc')
+        self.reader = reader_class(id_prefix)
+        self._lock = threading.Lock()
+        self.last_poll = 0
+        self._reset(None)
+
+    def _reset(self, inode):
+        self.inode = inode
+        self.stat = None
+        self.consumed = {}
+        self.channels = {}
+
+    def _record_counts(self):
+        """{time_var: number of valid records} of the live file."""
+        counts = {}
+        with nc_lock, netCDF4.Dataset(self.file_path) as nc:
+            for time_var in self.reader.TIME_VARIABLES:
+                if time_var not in nc.variables:
+                    continue
+                var = nc.variables[time_var]
+                length = valid_length(var)
+                counts[time_var] = var.shape[0] if length is None else length
+        return counts
+
+    def poll(self):
+        """Read the records appended to the live file since the last poll."""
+        with self._lock:
+            if time.monotonic() - self.last_poll < POLL_SECONDS:
+                return
+            self.last_poll = time.monotonic()
+            try:
+                stat = os.stat(self.file_path)
+            except FileNotFoundError:
+                self._reset(None)
+                return
+            if stat.st_ino != self.inode:
+                self._reset(stat.st_ino)
+            if self.stat == (stat.st_size, stat.st_mtime_ns):
+                return
+
+            try:
+                counts = self._record_counts()
+                if any(counts[var] < self.consumed.get(var, 0) for var in counts):
+                    self._reset(stat.st_ino)
+                record_slices = {var: slice(self.consumed.get(var, 0), count) for var, count in counts.items()}
+                if any(s.stop > s.start for s in record_slices.values()):
+                    data_file = self.reader(self.file_path, record_slices=record_slices)
+                    try:
+                        self._append(data_file.get_all_plot_data())
+                    finally:
+                        # Do not hold the live file open between polls
+                        data_file.close()
+                self.consumed = counts
+                self.stat = (stat.st_size, stat.st_mtime_ns)
+            except Exception as e:
+                print(f"Error reading live file {self.file_path}: {e}")
+
+    def _append(self, plot_data):
+        for trace in plot_data:
+            times, values = to_ns(trace['x']), np.asarray(trace['y'], dtype=float)
+            if len(times) == 0:
+                continue
+            name = str(trace['name'])
+            if name in self.channels:
+                old_times, old_values = self.channels[name]
+                times, values = np.concatenate([old_times, times]), np.concatenate([old_values, values])
+            self.channels[name] = (times, values)
+
+        newest = max((times[-1] for times, _ in self.channels.values() if len(times)), default=None)
+        if newest is None:
+            return
+        cutoff = newest - RETENTION_SECONDS * 10**9
+        for name, (times, values) in self.channels.items():
+            keep = np.searchsorted(times, cutoff)
+            if keep:
+                self.channels[name] = (times[keep:], values[keep:])
+
+    def max_time(self):
+        """Epoch seconds of the newest live sample, or None."""
+        self.poll()
+        with self._lock:
+            newest = [times[-1] for times, _ in self.channels.values() if len(times)]
+        return max(newest) / 10**9 if newest else None
+
+    def plot_data(self, start_time, end_time=None):
+        """Live samples of every channel inside [start_time, end_time] (epoch seconds; no end by default)."""
+        self.poll()
+        start_ns = int(start_time * 10**9)
+        plot_data = []
+        with self._lock:
+            for name, (times, values) in self.channels.items():
+                lo = np.searchsorted(times, start_ns)
+                hi = len(times) if end_time is None else np.searchsorted(times, int(end_time * 10**9), side='right')
+                if hi > lo:
+                    plot_data.append({'x': pd.DatetimeIndex(times[lo:hi].view('datetime64[ns]'), tz='UTC'),
+                                      'y': values[lo:hi], 'name': name})
+        return plot_data
+
+
+_live_tails = {}
+_live_tails_lock = threading.Lock()
+
+
+def get_live_tail(id_prefix):
+    """Return the process-wide LiveTail of an instrument."""
+    with _live_tails_lock:
+        if id_prefix not in _live_tails:
+            _live_tails[id_prefix] = LiveTail(id_prefix)
+        return _live_tails[id_prefix]
+
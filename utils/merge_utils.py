@@ -0,0 +1,65 @@
+import numpy as np
+import pandas as pd
+
+
+def to_ns(x):
+    """Epoch nanoseconds of a trace's x values (naive values are taken as UTC)."""
+    if isinstance(x, np.ndarray) and x.dtype == np.int64:
+        return x
+    return pd.DatetimeIndex(x).as_unit('ns').asi8
+
+
+def merge_channel(parts, start_ns=None, end_ns=None):
+    """
+    Merge the (times_ns, values) parts of one channel, each sorted by time, into one
+    time-ordered series. A stable sort of the concatenation merges the sorted runs,
+    so it costs O(n log k) for k parts. Samples repeated at the same time, where files
+    overlap, are kept once (from the first part), and the result is clipped to
+    [start_ns, end_ns] when given.
+    """
+    if len(parts) == 1:
+        times, values = parts[0]
+    else:
+        times = np.concatenate([t for t, _ in parts])
+        values = np.concatenate([v for _, v in parts])
+        order = np.argsort(times, kind='stable')
+        times, values = times[order], values[order]
+
+    if len(times) > 1:
+        keep = np.empty(len(times), dtype=bool)
+        keep[0] = True
+        np.not_equal(times[1:], times[:-1], out=keep[1:])
+        if not keep.all():
+            times, values = times[keep], values[keep]
+
+    lo = 0 if start_ns is None else np.searchsorted(times, start_ns, side='left')
+    hi = len(times) if end_ns is None else np.searchsorted(times, end_ns, side='right')
+    return times[lo:hi], values[lo:hi]
+
+
+def merge_plot_data(plot_data, window=None):
+    """
+    Merge traces read from several files (and the live file) into exactly one
+    contiguous trace per channel name, in order of first appearance, optionally
+    clipped to the (start_time, end_time) window in epoch seconds, where either
+    end may be None. Channels left without samples are dropped.
+    """
+    channels = {}
+    for trace in plot_data:
+        times = to_ns(trace['x'])
+        if len(times) == 0:
+            continue
+        values = np.asarray(trace['y'], dtype=float)
+        if len(times) > 1 and (np.diff(times) < 0).any():
+            order = np.argsort(times, kind='stable')
+            times, values = times[order], values[order]
+        channels.setdefault(str(trace['name']), []).append((times, values))
+
+    start_ns, end_ns = [None if t is None else int(t * 10**9) for t in (window or (None, None))]
+    merged = []
+    for name, parts in channels.items():
+        times, values = merge_channel(parts, start_ns, end_ns)
+        if len(times) == 0:
+            continue
+        merged.append({'x': pd.DatetimeIndex(times.view('datetime64[ns]'), tz='UTC'), 'y': values, 'name': name})
+    return merged
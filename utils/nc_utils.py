@@ -0,0 +1,244 @@
+import os
+import threading
+
+import numpy as np
+
+# Interior samples checked before trusting a time variable to be sorted
+MONOTONIC_CHECK_POINTS = 16
+# Samples after the valid part checked before trusting it to be zero padding
+PADDING_CHECK_POINTS = 16
+SECONDS_PER_DAY = 86400
+# Below this many records a whole time variable is read faster than it is binary searched
+BINARY_SEARCH_MIN_RECORDS = 1 << 20
+# Evenly spaced values read by any_nonzero before it reads every record
+NONZERO_SAMPLE_POINTS = 64
+# Bytes trimmed from both ends of fixed-width netCDF strings, as a lookup table
+STRING_PADDING = np.zeros(256, dtype=bool)
+STRING_PADDING[list(b'\x00 \t\n\r\x0b\x0c')] = True
+
+
+class NetCDFLock:
+    """
+    Process-wide reentrant lock around netCDF I/O. The HDF5 library under netCDF4 is
+    not thread-safe and netCDF4 releases the GIL while it reads, so request, warm-up
+    and live-tail threads must not be inside it at once. A forked scan worker gets a
+    fresh lock, as the parent may have been holding it.
+    """
+
+    def __init__(self):
+        self._reset()
+
+    def _reset(self):
+        self._lock = threading.RLock()
+
+    def __enter__(self):
+        self._lock.acquire()
+        return self
+
+    def __exit__(self, *exc_info):
+        self._lock.release()
+
+
+nc_lock = NetCDFLock()
+os.register_at_fork(after_in_child=nc_lock._reset)
+
+
+def read_time(var, i):
+    """Read one sample of a time variable as float; masked or missing samples read as 0."""
+    value = var[i]
+    if np.ma.is_masked(value):
+        return 0.0
+    return float(value)
+
+
+def _first_index(var, lo, hi, predicate):
+    """First index in [lo, hi) whose sample satisfies predicate, assuming it holds for a suffix."""
+    while lo < hi:
+        mid = (lo + hi) // 2
+        if predicate(read_time(var, mid)):
+            hi = mid
+        else:
+            lo = mid + 1
+    return lo
+
+
+def valid_length(var):
+    """
+    Number of valid (> 0) samples of a time variable whose unused records are
+    zero-padded at the end, found by binary search on the on-disk array.
+    Returns None when the variable does not look like a sorted, zero-padded series,
+    e.g. when the search stopped in a run of zero or masked samples inside the data.
+    """
+    n = var.shape[0]
+    if n == 0:
+        return 0
+    if read_time(var, 0) <= 0:
+        return None
+    length = _first_index(var, 1, n, lambda t: t <= 0)
+
+    # Spot-check that everything after the valid part really is padding, not a dropout
+    if length < n:
+        checks = np.unique(np.linspace(length, n - 1, min(n - length, PADDING_CHECK_POINTS)).astype(int))
+        if any(read_time(var, i) > 0 for i in checks):
+            return None
+
+    # Spot-check that the valid part really is sorted before trusting binary searches on it
+    checks = np.unique(np.linspace(0, length - 1, min(length, MONOTONIC_CHECK_POINTS)).astype(int))
+    samples = [read_time(var, i) for i in checks]
+    if any(b < a for a, b in zip(samples, samples[1:])):
+        return None
+    return length
+
+
+def time_slice(var, start_time, end_time):
+    """
+    Index slice of the samples of a sorted time variable within [start_time, end_time]
+    (epoch seconds), found by binary search without reading the whole variable.
+    Returns None when the variable is not sorted, or is shorter than BINARY_SEARCH_MIN_RECORDS
+    and so faster to read in full, so the caller falls back to a full read.
+    """
+    if var.shape[0] < BINARY_SEARCH_MIN_RECORDS:
+        return None
+    length = valid_length(var)
+    if length is None:
+        return None
+    lo = _first_index(var, 0, length, lambda t: t >= start_time)
+    hi = _first_index(var, lo, length, lambda t: t > end_time)
+    return slice(lo, hi)
+
+
+def search_time(var, lo, hi, value, side='left'):
+    """np.searchsorted of value in the sorted samples var[lo:hi], by binary search on the on-disk array."""
+    if side == 'left':
+        return _first_index(var, lo, hi, lambda t: t >= value)
+    return _first_index(var, lo, hi, lambda t: t > value)
+
+
+def days_present(var, lo, hi):
+    """
+    Epoch day numbers (UTC) holding at least one of the sorted samples var[lo:hi],
+    found with one binary search per day instead of reading every sample.
+    """
+    days = []
+    i = lo
+    while i < hi:
+        day = int(read_time(var, i) // SECONDS_PER_DAY)
+        days.append(day)
+        i = search_time(var, i + 1, hi, (day + 1) * SECONDS_PER_DAY)
+    return days
+
+
+def scan_time(var, valid_start=0, valid_end=np.inf):
+    """
+    Min and max (epoch seconds), epoch day numbers and records (a slice or a boolean
+    mask) of the valid (> 0) samples of a time variable within [valid_start, valid_end],
+    or None when there are none.
+    Large sorted, zero-padded variables only have their endpoints and day boundaries
+    read, so their cost does not grow with the number of samples; any other variable
+    is read in full.
+    """
+    length = valid_length(var) if var.shape[0] >= BINARY_SEARCH_MIN_RECORDS else None
+    if length is not None:
+        lo = search_time(var, 0, length, valid_start)
+        hi = search_time(var, lo, length, valid_end, side='right')
+        if lo == hi:
+            return None
+        return read_time(var, lo), read_time(var, hi - 1), days_present(var, lo, hi), slice(lo, hi)
+
+    times = np.ma.filled(var[:], 0).astype(float)
+    records = (times > 0) & (times >= valid_start) & (times <= valid_end)
+    times = times[records]
+    if len(times) == 0:
+        return None
+    return times.min(), times.max(), np.unique(times // SECONDS_PER_DAY).astype(int).tolist(), records
+
+
+def epoch_ns(seconds):
+    """
+    Epoch nanoseconds of float epoch seconds, equal to pd.to_datetime(seconds, unit='s'):
+    whole seconds and the fraction are scaled separately, as float64 cannot hold
+    nanoseconds since 1970 exactly.
+    """
+    whole = np.trunc(seconds)
+    return whole.astype(np.int64) * 10**9 + (np.round(seconds - whole, 9) * 1e9).astype(np.int64)
+
+
+def _char_matrix(chars):
+    """(strings, width) uint8 view of a char variable read as (n, width) 'S1' or (n,) fixed-width bytes."""
+    chars = np.ma.filled(chars, b'')
+    if chars.dtype.kind == 'U':
+        chars = chars.astype('S')
+    width = chars.dtype.itemsize * (chars.shape[1] if chars.ndim == 2 else 1)
+    return np.ascontiguousarray(chars).view(np.uint8).reshape(len(chars), width)
+
+
+def _trimmed_bounds(matrix):
+    """Start and end column of every row once the padding on both ends is trimmed."""
+    if matrix.shape[1] == 0:
+        return np.zeros(len(matrix), dtype=int), np.zeros(len(matrix), dtype=int)
+    keep = ~STRING_PADDING[matrix]
+    any_kept = keep.any(axis=1)
+    start = np.where(any_kept, keep.argmax(axis=1), 0)
+    end = np.where(any_kept, matrix.shape[1] - keep[:, ::-1].argmax(axis=1), 0)
+    return start, end
+
+
+def chars_equal(chars, value):
+    """
+    Boolean array telling which strings of a char variable equal value once nulls and
+    whitespace are trimmed from both ends, comparing bytes without per-string Python.
+    """
+    matrix = _char_matrix(chars)
+    pattern = np.frombuffer(value.encode(), dtype=np.uint8)
+    start, end = _trimmed_bounds(matrix)
+    equal = end - start == len(pattern)
+    if len(pattern) and matrix.shape[1]:
+        columns = np.minimum(start[:, None] + np.arange(len(pattern)), matrix.shape[1] - 1)
+        equal &= (np.take_along_axis(matrix, columns, axis=1) == pattern).all(axis=1)
+    return equal
+
+
+def decode_chars(chars):
+    """
+    Strings of a char variable with nulls and whitespace trimmed from both ends. Rows
+    are trimmed as bytes and only distinct values are decoded, so a state variable
+    sampled at every record costs a handful of decodes.
+    """
+    matrix = _char_matrix(chars)
+    if matrix.shape[1] == 0:
+        return np.full(len(matrix), '')
+    start, end = _trimmed_bounds(matrix)
+    # Shift every row left past its leading padding and zero what follows its end
+    columns = np.arange(matrix.shape[1])
+    trimmed = np.take_along_axis(matrix, np.minimum(start[:, None] + columns, matrix.shape[1] - 1), axis=1)
+    trimmed[columns >= (end - start)[:, None]] = 0
+    # Fixed-width bytes drop trailing nulls
+    values, inverse = np.unique(trimmed.view(f'S{matrix.shape[1]}').ravel(), return_inverse=True)
+    return np.array([value.decode(errors='replace') for value in values])[inverse]
+
+
+def record_count(records):
+    """Number of records selected by a slice with explicit bounds or a boolean mask."""
+    if isinstance(records, slice):
+        return records.stop - records.start
+    return int(np.count_nonzero(records))
+
+
+def read_records(var, records):
+    """Values of var at records (a slice or a boolean mask), masked values as 0."""
+    if isinstance(records, slice):
+        return np.ma.filled(var[records], 0)
+    return np.ma.filled(var[:], 0)[records]
+
+
+def any_nonzero(var, records):
+    """
+    Whether var has a non-zero value at records (a slice or a boolean mask). Long slices
+    are first sampled with one strided read of NONZERO_SAMPLE_POINTS values, so a channel
+    with data rarely needs more; every record is read only when the samples are all zero.
+    """
+    if isinstance(records, slice) and record_count(records) > NONZERO_SAMPLE_POINTS:
+        step = record_count(records) // NONZERO_SAMPLE_POINTS
+        if np.ma.filled(var[records.start:records.stop:step], 0).any():
+            return True
+    return bool(read_records(var, records).any())
@@ -1,10 +1,164 @@
+import base64
 import plotly.graph_objs as go
 from plotly.subplots import make_subplots
 import numpy as np
+import pandas as pd
+from utils.data_utils import load_config
+from utils.merge_utils import to_ns
+
+config_path = "./config.yaml"
+config = load_config(config_path)
+decimation_config = config.get('decimation', {})
+transport_config = config.get('transport', {})
+webgl_config = config.get('webgl', {})
 
 group_gap = 100
+# Graph width assumed until the browser has reported its own
+DEFAULT_GRAPH_WIDTH = 1600
+
+
+def target_points(graph_width):
+    """Number of points to keep per trace for a graph graph_width pixels wide."""
+    if not graph_width:
+        graph_width = DEFAULT_GRAPH_WIDTH
+    return int(graph_width * decimation_config.get('points_per_pixel', 2))
+
+
+def minmax_indices(y, n_out):
+    """
+    Indices of a min/max envelope: the minimum and maximum of each of n_out // 2
+    equal buckets, the first NaN of each bucket holding one, and the first and last
+    sample. Every peak survives, and every dropout stays a break in the line.
+    """
+    n = len(y)
+    buckets = max(1, n_out // 2)
+    size = -(-n // buckets)
+    padded = np.full(buckets * size, np.nan)
+    padded[:n] = y
+    padded = padded.reshape(buckets, size)
+    offsets = np.arange(buckets) * size
+    missing = np.isnan(padded)
+    with np.errstate(invalid='ignore'):
+        lows = np.where(missing, np.inf, padded).argmin(axis=1) + offsets
+        highs = np.where(missing, -np.inf, padded).argmax(axis=1) + offsets
+    # The padding after the last sample is not a dropout
+    missing.ravel()[n:] = False
+    gaps = (missing.argmax(axis=1) + offsets)[missing.any(axis=1)]
+    indices = np.unique(np.concatenate([[0, n - 1], lows, highs, gaps]))
+    return indices[indices < n]
+
+
+def lttb_indices(x, y, n_out):
+    """
+    Indices chosen by Largest-Triangle-Three-Buckets: the first and last sample plus,
+    for each of n_out - 2 buckets, the point forming the largest triangle with the
+    previously chosen point and the mean of the next bucket.
+    """
+    n = len(y)
+    edges = np.linspace(1, n - 1, n_out - 1).astype(np.int64)
+    indices = np.empty(n_out, dtype=np.int64)
+    indices[0], indices[-1] = 0, n - 1
+    selected = 0
+    for i in range(n_out - 2):
+        start, end = edges[i], edges[i + 1]
+        next_end = edges[i + 2] if i + 2 < len(edges) else n
+        next_x = x[end:next_end].mean() if next_end > end else x[n - 1]
+        next_y = y[end:next_end].mean() if next_end > end else y[n - 1]
+        if end <= start:
+            indices[i + 1] = start
+            continue
+        areas = np.abs((x[selected] - next_x) * (y[start:end] - y[selected])
+                       - (x[selected] - x[start:end]) * (next_y - y[selected]))
+        selected = start + int(areas.argmax())
+        indices[i + 1] = selected
+    return np.unique(indices)
+
+
+def lttb_gap_indices(x, y, n_out):
+    """
+    LTTB over each run of finite samples, with a share of n_out in proportion to its
+    length, plus the first NaN after every run, so dropouts stay breaks in the line
+    instead of being bridged. Returns None when the runs alone need more than n_out points.
+    """
+    edges = np.flatnonzero(np.diff(np.r_[False, np.isfinite(y), False].astype(np.int8)))
+    starts, ends = edges[::2], edges[1::2]
+    gaps = ends[ends < len(y)]
+    budget = n_out - len(gaps)
+    if budget < 2 * len(starts):
+        return None
+
+    total = (ends - starts).sum()
+    parts = [gaps]
+    for start, end in zip(starts, ends):
+        share = max(2, budget * (end - start) // total)
+        if end - start <= share:
+            parts.append(np.arange(start, end))
+        else:
+            parts.append(start + lttb_indices(x[start:end], y[start:end], share))
+    return np.unique(np.concatenate(parts))
+
+
+def decimate(x, y, n_out, method=None):
+    """
+    Reduce a trace to about n_out points with the 'minmax' envelope or 'lttb'.
+    Traces that are already small enough are returned unchanged. Both methods keep a
+    NaN in every dropout; lttb falls back to minmax when there are too many of them.
+    """
+    y = np.asarray(y, dtype=float)
+    if n_out is None or len(y) <= n_out or n_out < 4:
+        return x, y
+
+    method = method or decimation_config.get('method', 'minmax')
+    if method == 'lttb':
+        x_index = pd.Index(x)
+        x_numeric = x_index.asi8 if isinstance(x_index, pd.DatetimeIndex) else np.asarray(x_index, dtype=float)
+        if np.count_nonzero(np.isfinite(y)) <= n_out:
+            return x, y
+        indices = lttb_gap_indices(x_numeric.astype(float), y, n_out)
+        if indices is None:
+            indices = minmax_indices(y, n_out)
+    else:
+        indices = minmax_indices(y, n_out)
+
+    if isinstance(x, (pd.Series, pd.Index)):
+        return x.take(indices), y[indices]
+    return np.asarray(x)[indices], y[indices]
+
+
+def typed_array(values, dtype):
+    """Plotly.js typed-array spec: little-endian values of dtype ('f4', 'f8', ...) as base64."""
+    data = np.ascontiguousarray(values, dtype=np.dtype(dtype).newbyteorder('<'))
+    return {'dtype': dtype, 'bdata': base64.b64encode(data.tobytes()).decode('ascii')}
+
+
+def encode_figure(fig, traces):
+    """
+    Figure dict with every trace's x sent as float64 epoch milliseconds and y as
+    float32, both as base64 typed arrays instead of ISO strings and JSON floats.
+    traces holds the (x, y) arrays of the figure's traces, in figure order.
+    """
+    fig.update_xaxes(type='date')
+    fig_dict = fig.to_plotly_json()
+    for trace, (x, y) in zip(fig_dict['data'], traces):
+        trace['x'] = typed_array(to_ns(x) / 1e6, 'f8')
+        trace['y'] = typed_array(y, 'f4')
+    return fig_dict
+
 
-def update_plot(title, plot_data, hours, options, split_value):
+def scatter_class(total_points):
+    """go.Scattergl (WebGL) when the figure would hold more than webgl.point_threshold points, else go.Scatter (SVG)."""
+    if webgl_config.get('enabled', True) and total_points > webgl_config.get('point_threshold', 20000):
+        return go.Scattergl
+    return go.Scatter
+
+
+def update_plot(title, plot_data, hours, options, split_value, max_points=None):
+    """
+    Build the figure for plot_data, decimating each trace to max_points first
+    (see target_points) so the payload stays bounded for any time range.
+    Dense figures are drawn with WebGL traces (see scatter_class).
+    With transport.binary set the figure is returned as a dict of typed arrays (see encode_figure).
+    """
 
     if not plot_data:
         return go.Figure().add_annotation(text="No data available for the selected time range",
@@ -16,18 +170,20 @@ def update_plot(title, plot_data, hours, options, split_value):
 
     # Collect valid traces
     for trace in plot_data:
-        temp_data = np.array(trace['y'])
-        x_data = np.array(trace['x'])
+        x_data, temp_data = decimate(trace['x'], trace['y'], max_points)
+        ys.append(temp_data)
+        xs.append(x_data)
 
-        scatter = go.Scatter(
+    trace_class = scatter_class(sum(len(y) for y in ys))
+    for trace, x_data, temp_data in zip(plot_data, xs, ys):
+        scatter = trace_class(
             x=x_data,
             y=temp_data,
             name=trace['name'],
             mode='lines',
         )
         valid_traces.append(scatter)
-        ys.append(temp_data)
-        xs.append(x_data)
+    arrays = {id(trace): (x, y) for trace, x, y in zip(valid_traces, xs, ys)}
     # Set up subplots based on split_value
     if split_value is not None:
         lower_traces = [trace for trace in valid_traces if trace.y[-1] <= split_value]
@@ -53,10 +209,12 @@ def update_plot(title, plot_data, hours, options, split_value):
             trace.update(legendgroup="upper", legendgrouptitle_text=f"Temperature > {split_value}")
             fig.add_trace(trace, row=2, col=1)
         height = 800
+        ordered_traces = lower_traces + upper_traces
     else:
         for trace in valid_traces:
             fig.add_trace(trace, row=1, col=1)
         height = 600
+        ordered_traces = valid_traces
 
     # Update layout for group and group gap
     fig.update_layout(
@@ -77,4 +235,7 @@ def update_plot(title, plot_data, hours, options, split_value):
     if options and 'log' in options:
         for i in range(1, num_subplots + 1):
             fig.update_yaxes(type="log", row=i, col=1, title_text="Temperature (log K)")
+
+    if transport_config.get('binary'):
+        return encode_figure(fig, [arrays[id(trace)] for trace in ordered_traces])
     return fig
\ No newline at end of file
@@ -0,0 +1,161 @@
+import functools
+import hashlib
+import inspect
+import json
+import pickle
+import threading
+import time
+
+import dash_bootstrap_components as dbc
+
+from utils.config_utils import load_config
+from utils.file_index import SqliteStore, get_file_index
+from utils.single_flight import single_flight
+
+config_path = "./config.yaml"
+config = load_config(config_path)
+result_cache_config = config.get('result_cache', {})
+
+RESULT_CACHE_PATH = './cache/results.sqlite'
+TTL_SECONDS = result_cache_config.get('ttl_seconds', 300)
+MAX_BYTES = int(result_cache_config.get('max_mb', 256) * 2**20)
+# 'Last N hours' windows ending within the same bucket share one result
+BUCKET_SECONDS = result_cache_config.get('bucket_seconds', 60)
+# Graph widths are rounded up to a multiple of this, so similar screens share results
+WIDTH_STEP = 200
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS results (
+    key TEXT PRIMARY KEY,
+    instrument TEXT NOT NULL,
+    created REAL NOT NULL,
+    accessed REAL NOT NULL,
+    size INTEGER NOT NULL,
+    value BLOB NOT NULL
+);
+CREATE INDEX IF NOT EXISTS results_accessed ON results (accessed);
+"""
+
+
+def result_cache_enabled():
+    return bool(result_cache_config.get('enabled'))
+
+
+class ResultCache(SqliteStore):
+    """
+    Callback results shared by every thread and process of the app, with a TTL
+    and a total size bound; the least recently used results are evicted first.
+    """
+    schema = SCHEMA
+
+    def __init__(self, db_path=RESULT_CACHE_PATH, ttl_seconds=TTL_SECONDS, max_bytes=MAX_BYTES):
+        super().__init__(db_path)
+        self.ttl_seconds = ttl_seconds
+        self.max_bytes = max_bytes
+
+    def get(self, key):
+        """Return the cached result for key, or None when missing or expired."""
+        now = time.time()
+        conn = self._connect()
+        row = conn.execute('SELECT value FROM results WHERE key = ? AND created > ?',
+                           (key, now - self.ttl_seconds)).fetchone()
+        if row is None:
+            return None
+        conn.execute('UPDATE results SET accessed = ? WHERE key = ?', (now, key))
+        return pickle.loads(row[0])
+
+    def put(self, key, instrument, value):
+        """Store a result, then drop expired results and evict down to max_bytes."""
+        blob = pickle.dumps(value, protocol=pickle.HIGHEST_PROTOCOL)
+        if len(blob) > self.max_bytes:
+            return
+        now = time.time()
+        with self.transaction() as conn:
+            conn.execute('INSERT OR REPLACE INTO results (key, instrument, created, accessed, size, value) '
+                         'VALUES (?, ?, ?, ?, ?, ?)', (key, instrument, now, now, len(blob), blob))
+            conn.execute('DELETE FROM results WHERE created <= ?', (now - self.ttl_seconds,))
+            total = 0
+            evicted = []
+            for cached_key, size in conn.execute('SELECT key, size FROM results ORDER BY accessed DESC'):
+                total += size
+                if total > self.max_bytes:
+                    evicted.append((cached_key,))
+            conn.executemany('DELETE FROM results WHERE key = ?', evicted)
+
+
+_result_cache = None
+_result_cache_lock = threading.Lock()
+
+
+def get_result_cache():
+    """Return the process-wide ResultCache, opening it on first use."""
+    global _result_cache
+    with _result_cache_lock:
+        if _result_cache is None:
+            _result_cache = ResultCache()
+        return _result_cache
+
+
+def result_key(id_prefix, version, window, hours, params):
+    """
+    Key of a normalized query: the instrument and its index version, the window
+    (the end of 'Last N hours' windows snapped to BUCKET_SECONDS) and the other
+    callback parameters. A new index version makes every older key unreachable.
+    """
+    if window is not None and hours > 0:
+        window = (hours, window[1] // BUCKET_SECONDS)
+    query = [id_prefix, version, window, sorted(params.items())]
+    return hashlib.sha1(json.dumps(query, default=str).encode()).hexdigest()
+
+
+def _is_error(result):
+    items = result if isinstance(result, (list, tuple)) else [result]
+    return any(isinstance(item, dbc.Alert) and getattr(item, 'color', None) == 'danger' for item in items)
+
+
+def _compute(cache, key, id_prefix, version, func, arguments):
+    result = func(*arguments.values())
+    # A result computed while the index changed may mix old and new files; it is not
+    # stored under the old version's key, where later requests could still find it
+    if result is not None and not _is_error(result) and get_file_index().version(id_prefix) == version:
+        cache.put(key, id_prefix, result)
+    return result
+
+
+def cached_result(id_prefix):
+    """
+    Decorator for an Apply callback taking n_clicks, start_date, end_date, hours and
+    other query parameters: identical normalized queries are answered from the
+    shared ResultCache instead of being recomputed, and concurrent ones in this
+    process are computed once. graph_width is rounded up to WIDTH_STEP first.
+    Failed results (None or a 'danger' alert) are not cached, nor are results of a
+    query during which the instrument's index changed.
+    """
+    def decorator(func):
+        signature = inspect.signature(func)
+
+        @functools.wraps(func)
+        def wrapper(*args):
+            arguments = signature.bind(*args).arguments
+            n_clicks = next(iter(arguments.values()))
+            if n_clicks is None or not result_cache_enabled():
+                return func(*args)
+            from utils.data_utils import get_time_window
+            if arguments.get('graph_width'):
+                arguments['graph_width'] = -(-int(arguments['graph_width']) // WIDTH_STEP) * WIDTH_STEP
+
+            hours = arguments['hours']
+            window = get_time_window(id_prefix, hours, arguments['start_date'], arguments['end_date'])
+            params = {name: value for name, value in list(arguments.items())[1:]
+                      if name not in ('hours', 'start_date', 'end_date')}
+            version = get_file_index().version(id_prefix)
+            key = result_key(id_prefix, version, window, hours, params)
+
+            cache = get_result_cache()
+            result = cache.get(key)
+            if result is None:
+                # Identical queries arriving while this one runs wait for it instead of recomputing
+                result = single_flight.do(('result', key), _compute, cache, key, id_prefix, version, func, arguments)
+            return result
+        return wrapper
+    return decorator
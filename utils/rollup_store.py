@@ -0,0 +1,277 @@
+import threading
+from functools import partial
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+from utils.data_utils import load_config, fixed_directories, scan_files, get_file_index, rollups_enabled
+from utils.file_index import SqliteStore
+
+config_path = "./config.yaml"
+config = load_config(config_path)
+rollup_config = config.get('rollups', {})
+
+ROLLUP_PATH = './cache/rollups.sqlite'
+# Bin widths in seconds, finest first
+ROLLUP_BINS = sorted(rollup_config.get('bins', [60, 600, 3600, 86400]))
+# PRAGMA user_version of rollups built by the current readers;
+# 1: thermetry channel labels without their null padding
+ROLLUP_FORMAT = 1
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS rollups (
+    instrument TEXT NOT NULL,
+    bin_seconds INTEGER NOT NULL,
+    bin_start INTEGER NOT NULL,
+    channel TEXT NOT NULL,
+    name TEXT NOT NULL,
+    vmin REAL NOT NULL,
+    vmax REAL NOT NULL,
+    vsum REAL NOT NULL,
+    count INTEGER NOT NULL,
+    PRIMARY KEY (instrument, bin_seconds, bin_start, channel, name)
+);
+CREATE INDEX IF NOT EXISTS rollups_file ON rollups (instrument, name);
+CREATE TABLE IF NOT EXISTS rollup_files (
+    instrument TEXT NOT NULL,
+    name TEXT NOT NULL,
+    size INTEGER NOT NULL,
+    mtime REAL NOT NULL,
+    PRIMARY KEY (instrument, name)
+);
+"""
+
+
+def reader_class(id_prefix):
+    # Imported here because the data_files readers import utils.data_utils themselves
+    from data_files.rsr.rsfend import RsFendFile
+    from data_files.toltec.cryocmp_file import ToltecCryocmpFile
+    from data_files.toltec.dilutionfridge_file import ToltecDilutionFridgeFile
+    from data_files.toltec.thermetry_file import ToltecThermetryFile
+    return {
+        'thermetry': ToltecThermetryFile,
+        'dilutionFridge': ToltecDilutionFridgeFile,
+        'cryocmp': ToltecCryocmpFile,
+        'rsfend': RsFendFile,
+    }[id_prefix]
+
+
+def compute_file_rollups(id_prefix, file_path):
+    """
+    Aggregate every channel of one file into (bin_seconds, bin_start, channel, min, max, sum, count)
+    rows for each bin width in ROLLUP_BINS, or None when the file cannot be read.
+    """
+    rows = []
+    try:
+        data_file = reader_class(id_prefix)(str(file_path))
+        plot_data = data_file.get_all_plot_data()
+    except Exception as e:
+        print(f"Error reading {file_path} for rollups: {e}")
+        return None
+
+    for trace in plot_data:
+        times = pd.DatetimeIndex(trace['x']).as_unit('ns').asi8 // 10**9
+        values = np.asarray(trace['y'], dtype=float)
+        valid = np.isfinite(values)
+        times, values = times[valid], values[valid]
+        if len(values) == 0:
+            continue
+
+        for bin_seconds in ROLLUP_BINS:
+            bins = times - times % bin_seconds
+            order = np.argsort(bins, kind='stable')
+            bins, sorted_values = bins[order], values[order]
+            bin_starts, starts = np.unique(bins, return_index=True)
+            counts = np.diff(np.append(starts, len(bins)))
+            rows.extend(zip(
+                [bin_seconds] * len(bin_starts), bin_starts.tolist(), [trace['name']] * len(bin_starts),
+                np.minimum.reduceat(sorted_values, starts).tolist(),
+                np.maximum.reduceat(sorted_values, starts).tolist(),
+                np.add.reduceat(sorted_values, starts).tolist(),
+                counts.tolist()))
+    return rows
+
+
+class RollupStore(SqliteStore):
+    """
+    Multi-resolution per-channel min/mean/max/count aggregates of each instrument.
+
+    Rows are kept per source file, so a rewritten file simply replaces its own
+    rows; queries combine the files that share a bin.
+    """
+    schema = SCHEMA
+
+    def __init__(self, db_path=ROLLUP_PATH):
+        super().__init__(db_path)
+        self._rebuild_older_format()
+
+    def _rebuild_older_format(self):
+        """Have every file aggregated again when the rollups were built by older readers."""
+        with self.transaction() as conn:
+            if conn.execute('PRAGMA user_version').fetchone()[0] >= ROLLUP_FORMAT:
+                return
+            # Files without a rollup_files row are rebuilt by update_rollups, replacing their rows
+            conn.execute('DELETE FROM rollup_files')
+            conn.execute(f'PRAGMA user_version = {ROLLUP_FORMAT}')
+
+    def file_stats(self, instrument):
+        """Return {name: (size, mtime)} for every file that has rollups."""
+        rows = self._connect().execute(
+            'SELECT name, size, mtime FROM rollup_files WHERE instrument = ?', (instrument,))
+        return {name: (size, mtime) for name, size, mtime in rows}
+
+    def replace_file(self, instrument, name, size, mtime, rows):
+        with self.transaction() as conn:
+            conn.execute('DELETE FROM rollups WHERE instrument = ? AND name = ?', (instrument, name))
+            conn.executemany(
+                'INSERT INTO rollups (instrument, bin_seconds, bin_start, channel, name, vmin, vmax, vsum, count) '
+                'VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)',
+                [(instrument, b, start, channel, name, vmin, vmax, vsum, count)
+                 for b, start, channel, vmin, vmax, vsum, count in rows])
+            conn.execute('INSERT OR REPLACE INTO rollup_files (instrument, name, size, mtime) VALUES (?, ?, ?, ?)',
+                         (instrument, name, size, mtime))
+
+    def remove(self, instrument, names):
+        with self.transaction() as conn:
+            for name in names:
+                conn.execute('DELETE FROM rollups WHERE instrument = ? AND name = ?', (instrument, name))
+                conn.execute('DELETE FROM rollup_files WHERE instrument = ? AND name = ?', (instrument, name))
+
+    def channels(self, instrument):
+        """Return every channel name that has rollups, in the order the reader first produced them."""
+        rows = self._connect().execute(
+            'SELECT channel FROM rollups WHERE instrument = ? AND bin_seconds = ? '
+            'GROUP BY channel ORDER BY MIN(rowid)',
+            (instrument, ROLLUP_BINS[-1]))
+        return [channel for channel, in rows]
+
+    def query(self, instrument, bin_seconds, start_time, end_time):
+        """Return (channel, bin_start, min, max, mean, count) rows over [start_time, end_time], by channel and time."""
+        return self._connect().execute(
+            'SELECT channel, bin_start, MIN(vmin), MAX(vmax), SUM(vsum) / SUM(count), SUM(count) FROM rollups '
+            'WHERE instrument = ? AND bin_seconds = ? AND bin_start BETWEEN ? AND ? '
+            'GROUP BY channel, bin_start ORDER BY channel, bin_start',
+            (instrument, bin_seconds, start_time - start_time % bin_seconds, end_time)).fetchall()
+
+
+_rollup_store = None
+_rollup_store_lock = threading.Lock()
+
+
+def get_rollup_store():
+    """Return the process-wide RollupStore, opening it on first use."""
+    global _rollup_store
+    with _rollup_store_lock:
+        if _rollup_store is None:
+            _rollup_store = RollupStore()
+        return _rollup_store
+
+
+def update_rollups(id_prefix):
+    """
+    Bring the instrument's rollups in line with the file index: files that are new
+    or changed since their rollups were built are aggregated again and rollups of
+    files that left the index are dropped.
+    """
+    store = get_rollup_store()
+    indexed_files = get_file_index().file_stats(id_prefix)
+    rolled_up = store.file_stats(id_prefix)
+
+    removed = rolled_up.keys() - indexed_files.keys()
+    if removed:
+        store.remove(id_prefix, removed)
+
+    directory = Path(fixed_directories[id_prefix])
+    changed = [directory / name for name, stat in indexed_files.items() if rolled_up.get(name) != stat]
+    if not changed:
+        return 0
+
+    print(f"Building rollups for {len(changed)} {id_prefix} files")
+    for file_path, rows in scan_files(changed, func=partial(compute_file_rollups, id_prefix)):
+        if rows is None:
+            # Left without a rollup_files row, so the next update tries the file again
+            continue
+        size, mtime = indexed_files[file_path.name]
+        store.replace_file(id_prefix, file_path.name, size, mtime, rows)
+    return len(changed) + len(removed)
+
+
+# Instruments whose rollups are in line with the file index; the others are plotted from the raw files
+_rollups_current = set()
+_pending_rollups = set()
+_rollup_thread = None
+_rollup_lock = threading.Lock()
+
+
+def schedule_rollups(id_prefix):
+    """
+    Have the instrument's rollups brought in line with the file index by the background
+    rollup thread. use_rollups is False for the instrument until the update has finished.
+    """
+    global _rollup_thread
+    with _rollup_lock:
+        _rollups_current.discard(id_prefix)
+        _pending_rollups.add(id_prefix)
+        if _rollup_thread is None:
+            _rollup_thread = threading.Thread(target=_update_pending_rollups, name='rollups', daemon=True)
+            _rollup_thread.start()
+
+
+def _update_pending_rollups():
+    global _rollup_thread
+    while True:
+        with _rollup_lock:
+            if not _pending_rollups:
+                _rollup_thread = None
+                return
+            id_prefix = _pending_rollups.pop()
+        try:
+            update_rollups(id_prefix)
+        except Exception as e:
+            print(f"Error building rollups for {id_prefix}: {e}")
+            continue
+        with _rollup_lock:
+            # Rescheduled while it ran: the update it was waiting for is still to come
+            if id_prefix not in _pending_rollups:
+                _rollups_current.add(id_prefix)
+
+
+def use_rollups(id_prefix, window):
+    """Whether a (start_time, end_time) window is long enough to plot from the rollups, and they are up to date."""
+    if not rollups_enabled or window is None or id_prefix not in _rollups_current:
+        return False
+    return window[1] - window[0] > rollup_config.get('min_window_hours', 48) * 3600
+
+
+def choose_bin(start_time, end_time, max_points):
+    """Finest bin width whose min/max envelope over the window fits in max_points."""
+    for bin_seconds in ROLLUP_BINS:
+        if 2 * (end_time - start_time) / bin_seconds <= max_points:
+            return bin_seconds
+    return ROLLUP_BINS[-1]
+
+
+def get_rollup_plot_data(id_prefix, start_time, end_time, max_points, channels=None):
+    """
+    Plot data for [start_time, end_time] (epoch seconds) read from the rollups.
+    Each trace is the min/max envelope of its bins, so peaks and dropouts stay visible.
+    Traces come in the order of channels, or the reader's order without them, as on the raw file path.
+    """
+    bin_seconds = choose_bin(start_time, end_time, max_points)
+    rows = get_rollup_store().query(id_prefix, bin_seconds, start_time, end_time)
+    if not rows:
+        return []
+
+    channel_names, bin_starts, vmins, vmaxs, _, _ = map(np.asarray, zip(*rows))
+    breaks = np.flatnonzero(channel_names[1:] != channel_names[:-1]) + 1
+    plot_data = []
+    for lo, hi in zip(np.r_[0, breaks], np.r_[breaks, len(rows)]):
+        channel = channel_names[lo]
+        if channels is not None and channel not in channels:
+            continue
+        x = pd.to_datetime(np.repeat(bin_starts[lo:hi].astype(np.int64), 2), unit='s', utc=True)
+        y = np.column_stack([vmins[lo:hi], vmaxs[lo:hi]]).astype(float).ravel()
+        plot_data.append({'x': x, 'y': y, 'name': str(channel)})
+    order = {channel: i for i, channel in enumerate(channels or get_rollup_store().channels(id_prefix))}
+    return sorted(plot_data, key=lambda trace: order.get(trace['name'], len(order)))
@@ -0,0 +1,85 @@
+import os
+import threading
+import time
+import traceback
+
+_status_lock = threading.Lock()
+_status = {'state': 'not started', 'instruments': {}, 'started': None, 'finished': None}
+
+
+def warmup_status():
+    """Copy of the warm-up progress: overall state plus the step each instrument has reached."""
+    with _status_lock:
+        return {**_status, 'instruments': dict(_status['instruments'])}
+
+
+def _set_status(id_prefix=None, step=None, **fields):
+    with _status_lock:
+        _status.update(fields)
+        if id_prefix is not None:
+            _status['instruments'][id_prefix] = step
+
+
+def load_default_view(id_prefix, hours):
+    """Load the data of the instrument's default 'Last N hours' view into the file cache and live tail."""
+    from utils.data_utils import fixed_directories, get_file_index, get_time_window
+    from utils.file_cache import file_cache_enabled, open_data_file
+    from utils.live_tail import live_tail_enabled, get_live_tail
+    from utils.rollup_store import reader_class
+
+    window = get_time_window(id_prefix, hours, None, None)
+    if window is not None and file_cache_enabled():
+        directory = fixed_directories[id_prefix]
+        index = get_file_index()
+        for name in index.files_overlapping(id_prefix, *window):
+            # The same skipped variables as the Apply callbacks, so they find these cache entries
+            open_data_file(reader_class(id_prefix), os.path.join(directory, name), window,
+                           index.empty_variables(id_prefix, name))
+    if live_tail_enabled():
+        get_live_tail(id_prefix).poll()
+
+
+def _warm(id_prefix, step, func, *args):
+    """Run one warm-up step of an instrument, recording it in the status; False if it failed."""
+    _set_status(id_prefix, step)
+    try:
+        func(*args)
+        return True
+    except Exception as e:
+        print(f"Warm-up failed for {id_prefix} while {step}: {e}")
+        print(traceback.format_exc())
+        _set_status(id_prefix, f'failed while {step}: {e}')
+        return False
+
+
+def _run(instruments, hours):
+    # The data stack is first imported here, in the background, instead of at startup
+    from utils.data_utils import fixed_directories, get_index_summary
+
+    instruments = [i for i in instruments if os.path.isdir(fixed_directories.get(i, ''))]
+    _set_status(instruments={id_prefix: 'pending' for id_prefix in instruments})
+    # Index every instrument before opening any data file: the index scan forks worker
+    # processes, which must not happen while this thread is inside the HDF5 library
+    indexed = []
+    for id_prefix in instruments:
+        if _warm(id_prefix, 'indexing', get_index_summary, id_prefix):
+            _set_status(id_prefix, 'indexed')
+            indexed.append(id_prefix)
+    for id_prefix in indexed:
+        if _warm(id_prefix, 'loading data', load_default_view, id_prefix, hours):
+            _set_status(id_prefix, 'ready')
+    _set_status(state='ready', finished=time.time())
+    print(f"Warm-up finished: {warmup_status()['instruments']}")
+
+
+_warmup_thread = None
+
+
+def start_warmup(instruments, hours=5):
+    """Warm up the given instruments once, in a background thread."""
+    global _warmup_thread
+    if _warmup_thread is None:
+        _set_status(state='running', started=time.time())
+        _warmup_thread = threading.Thread(target=_run, args=(instruments, hours), name='warmup', daemon=True)
+        _warmup_thread.start()
+    return _warmup_thread
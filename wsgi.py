@@ -9,5 +9,12 @@ site.addsitedir(venv_path)
 
 sys.path.insert(0, '/home/lmtmc_umass_edu/lmt_housekeeping')
 
+from utils import import_profile
+if import_profile.profiling_requested():
+    import_profile.enable()
+
 from app import app
-server = app.server
\ No newline at end of file
+server = app.server
+
+if import_profile.profiling_requested():
+    import_profile.report()
\ No newline at end of file